@@ -0,0 +1,108 @@
+"""
+Group Commit Benchmark
+Measures throughput and latency of concurrent task updates committed one by
+one versus coalesced by database.group_commit
+
+Usage: python benchmark_group_commit.py [--writers N] [--writes N]
+
+Runs against a scratch database in a temporary directory.
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import database as db
+import migrate
+
+WINDOWS = [0.0005, 0.002, 0.005]
+
+def setup_database(task_count: int):
+    """Create a fresh, fully migrated database with one project of tasks"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.init_database()
+        migrate.run_migrations()
+    
+    project_id = db.get_all_projects()[0]['id']
+    now = datetime.now().isoformat()
+    task_ids = []
+    for i in range(task_count):
+        task_id = str(uuid.uuid4())
+        db.create_task({
+            'id': task_id, 'project_id': project_id, 'name': f'Task {i}',
+            'start_date': '2026-01-01', 'end_date': '2026-01-10', 'progress': 0.0,
+            'color': '#4285f4', 'dependencies': [], 'is_milestone': False,
+            'priority': 'medium', 'created_at': now, 'updated_at': now
+        })
+        task_ids.append(task_id)
+    return task_ids
+
+def run_writers(task_ids, writers: int, writes: int) -> dict:
+    """Update tasks from concurrent threads and collect per-write latencies"""
+    latencies = []
+    latency_lock = threading.Lock()
+    commits_before = db.group_commit.stats['commits']
+    
+    def writer(task_id):
+        local = []
+        for i in range(writes):
+            started = time.perf_counter()
+            db.update_task(task_id, {'progress': float(i % 100)})
+            local.append(time.perf_counter() - started)
+        with latency_lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=writer, args=(task_ids[i % len(task_ids)],)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    total = writers * writes
+    commits = db.group_commit.stats['commits'] - commits_before
+    latencies.sort()
+    return {
+        'writes_per_sec': total / elapsed,
+        'commits_per_sec': commits / elapsed,
+        'writes_per_commit': total / commits if commits else 0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark group commit for task updates")
+    parser.add_argument('--writers', type=int, default=16, help="concurrent writer threads")
+    parser.add_argument('--writes', type=int, default=100, help="updates per writer")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='gantt-bench-')
+    os.chdir(workdir)
+    task_ids = setup_database(args.writers)
+    
+    print("=" * 72)
+    print(f"Group commit benchmark: {args.writers} writers x {args.writes} updates")
+    print("=" * 72)
+    print(f"{'mode':<18}{'writes/s':>10}{'commits/s':>11}{'writes/commit':>15}{'p50 ms':>9}{'p99 ms':>9}")
+    
+    modes = [('one per write', None)] + [(f'group {window * 1000:g} ms', window) for window in WINDOWS]
+    for label, window in modes:
+        if window is not None:
+            db.group_commit.window = window
+            db.group_commit.start()
+        result = run_writers(task_ids, args.writers, args.writes)
+        db.group_commit.stop()
+        print(f"{label:<18}{result['writes_per_sec']:>10.0f}{result['commits_per_sec']:>11.0f}"
+              f"{result['writes_per_commit']:>15.1f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+    
+    print(f"\nScratch database left in {workdir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Serialization Benchmark
+Measures the time to encode the /api/tasks payload (flat list, subtask tree
+and critical path) and its size, with FastAPI's default encoding versus
+main.FastJSONResponse
+
+Usage: python benchmark_serialization.py [--sizes 1000,10000,50000] [--repeat N]
+
+Run from the repository root. Tasks are generated in memory; no database is used.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main
+
+PRIORITIES = ['low', 'medium', 'high', 'critical']
+
+def generate_tasks(count: int, project_id: str) -> list:
+    """Generate tasks shaped like database rows, about a third of them subtasks"""
+    rng = random.Random(count)
+    start = date(2026, 1, 1)
+    tasks = []
+    for i in range(count):
+        task_start = start + timedelta(days=rng.randint(0, 365))
+        parent = tasks[rng.randrange(len(tasks))] if tasks and rng.random() < 0.35 else None
+        created = f"2026-01-01T00:00:{i % 60:02d}.{i:06d}"
+        tasks.append({
+            'id': str(uuid.uuid4()),
+            'project_id': project_id,
+            'name': f'Task {i}',
+            'start_date': task_start.isoformat(),
+            'end_date': (task_start + timedelta(days=rng.randint(1, 30))).isoformat(),
+            'progress': float(rng.randint(0, 100)),
+            'color': '#4285f4',
+            'dependencies': [tasks[rng.randrange(i)]['id']] if i and rng.random() < 0.2 else [],
+            'is_milestone': rng.random() < 0.05,
+            'parent_id': parent['id'] if parent else None,
+            'description': 'Generated for the serialization benchmark',
+            'assigned_to': f'user{rng.randint(1, 20)}',
+            'priority': rng.choice(PRIORITIES),
+            'created_at': created,
+            'updated_at': created,
+            'rollup_start': None,
+            'rollup_end': None,
+            'rollup_progress': None
+        })
+    return tasks
+
+def build_payload(count: int) -> dict:
+    """Build the /api/tasks payload the endpoint would return for count tasks"""
+    project_id = str(uuid.uuid4())
+    tasks = generate_tasks(count, project_id)
+    critical_path = [task['id'] for task in tasks[::20]]
+    return main.build_tasks_payload(tasks, critical_path, project_id)
+
+def time_encoding(encode, payload, repeat: int) -> tuple:
+    """Median encoding time in milliseconds and the encoded size in bytes"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(payload)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, len(body)
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding of the task payload")
+    parser.add_argument('--sizes', default='1000,10000,50000', help="comma-separated task counts")
+    parser.add_argument('--repeat', type=int, default=5, help="encodings per measurement")
+    args = parser.parse_args()
+    
+    encoders = [
+        ('fastapi default', lambda payload: JSONResponse(jsonable_encoder(payload)).body),
+        ('json only', lambda payload: JSONResponse(payload).body),
+        ('orjson' if main.orjson is not None else 'fast response', lambda payload: main.FastJSONResponse(payload).body)
+    ]
+    
+    print("=" * 72)
+    print(f"Serialization benchmark: /api/tasks payload, median of {args.repeat} runs")
+    print(f"Fast response encoder: {'orjson' if main.orjson is not None else 'json (orjson not installed)'}")
+    print("=" * 72)
+    print(f"{'tasks':>7}  {'encoder':<18}{'ms':>10}{'speedup':>9}{'size KiB':>11}")
+    
+    for size in (int(size) for size in args.sizes.split(',')):
+        payload = build_payload(size)
+        baseline = None
+        for label, encode in encoders:
+            elapsed_ms, size_bytes = time_encoding(encode, payload, args.repeat)
+            baseline = baseline or elapsed_ms
+            print(f"{size:>7}  {label:<18}{elapsed_ms:>10.1f}{baseline / elapsed_ms:>8.1f}x{size_bytes / 1024:>11.0f}")
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -1023,18 +1023,225 @@
 
 import sqlite3
 import json
+import html
+import time
+import zlib
+import atexit
+import threading
+import sys
+import secrets
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import Iterator, List, Optional, Dict
 import os
 
 DATABASE_FILE = "gantt_app.db"
 
-def get_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(DATABASE_FILE)
+# Connection accounting, reported by the health endpoints. Shard connections
+# waiting in the pool are counted as pooled rather than open. Connections are
+# opened and closed on request, writer and committer threads alike, so the
+# counters only change under the lock. It is reentrant because __del__ can run
+# on a thread that already holds it.
+_connection_stats = {'opened': 0, 'closed': 0, 'pooled': 0, 'peak_open': 0}
+_connection_stats_lock = threading.RLock()
+
+def _open_connection_count() -> int:
+    return _connection_stats['opened'] - _connection_stats['closed'] - _connection_stats['pooled']
+
+def _count_connections(opened: int = 0, closed: int = 0, pooled: int = 0):
+    """Adjust the connection counters and the peak number open"""
+    with _connection_stats_lock:
+        _connection_stats['opened'] += opened
+        _connection_stats['closed'] += closed
+        _connection_stats['pooled'] += pooled
+        _connection_stats['peak_open'] = max(_connection_stats['peak_open'], _open_connection_count())
+
+class TrackedConnection(sqlite3.Connection):
+    """sqlite3 connection that keeps the open/closed counters up to date"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tracked_closed = False
+        _count_connections(opened=1)
+    
+    def close(self):
+        if not self._tracked_closed:
+            self._tracked_closed = True
+            _count_connections(closed=1)
+        super().close()
+    
+    def __del__(self):
+        # Connections dropped without close() (e.g. on an exception) still count as
+        # closed. sqlite3 frees the handle itself; calling close() here would fail
+        # when the collector runs on another thread.
+        if not getattr(self, '_tracked_closed', True):
+            self._tracked_closed = True
+            _count_connections(closed=1)
+
+# Sharded storage
+# With GANTT_STORAGE=sharded each project's tasks and action logs live in their
+# own database file under SHARD_DIRECTORY, so one project's writes never wait on
+# another's. gantt_app.db becomes the catalog: projects, notes, planners, files,
+# and task_shards, which records the project holding each task. Shards are
+# opened on first use and at most MAX_OPEN_SHARDS idle connections are kept.
+SHARDED_STORAGE = os.environ.get('GANTT_STORAGE', 'single') == 'sharded'
+SHARD_DIRECTORY = os.environ.get('GANTT_SHARD_DIR', 'shards')
+MAX_OPEN_SHARDS = int(os.environ.get('GANTT_MAX_OPEN_SHARDS', '32'))
+
+class PooledConnection(TrackedConnection):
+    """Shard connection whose close() hands it back to its pool"""
+    pool = None
+    project_id = None
+    
+    def close(self):
+        if self.pool is not None and not self._tracked_closed:
+            self.pool.release(self)
+        else:
+            super().close()
+    
+    def __del__(self):
+        self.pool = None
+        super().__del__()
+
+class ShardPool:
+    """Lazily opened per-project shard connections with a cap on idle handles"""
+    def __init__(self, directory: str, max_open: int):
+        self.directory = directory
+        self.max_open = max_open
+        self.stats = {'opened': 0, 'reused': 0, 'evicted': 0}
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._ready = set()
+        self._lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+    
+    def path(self, project_id: str) -> str:
+        """Get the database file holding a project's shard"""
+        if not project_id or not all(c.isalnum() or c in '-_' for c in project_id):
+            raise ValueError(f"Invalid project ID for a shard: {project_id!r}")
+        return os.path.join(self.directory, f'{project_id}.db')
+    
+    def idle(self) -> int:
+        """Number of open connections waiting in the pool"""
+        return self._idle_count
+    
+    def connect(self, project_id: str):
+        """Get a connection to a project's shard, creating the shard if needed"""
+        with self._lock:
+            pooled = self._idle.get(project_id)
+            if pooled:
+                conn = pooled.pop()
+                self._idle_count -= 1
+                _count_connections(pooled=-1)
+                if not pooled:
+                    del self._idle[project_id]
+                self.stats['reused'] += 1
+                return conn
+        
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.path(project_id), factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        self.stats['opened'] += 1
+        
+        if project_id not in self._ready:
+            # Imported here because migrate imports this module
+            import migrate
+            # One thread brings the shard's schema up to date; the others wait for it
+            with self._schema_lock:
+                if project_id not in self._ready:
+                    migrate.create_shard_schema(conn.cursor())
+                    conn.commit()
+                    self._ready.add(project_id)
+        
+        conn.pool = self
+        conn.project_id = project_id
+        return conn
+    
+    def release(self, conn):
+        """Take back a connection, closing the least recently used beyond the cap"""
+        conn.rollback()
+        with self._lock:
+            self._idle.setdefault(conn.project_id, []).append(conn)
+            self._idle.move_to_end(conn.project_id)
+            self._idle_count += 1
+            _count_connections(pooled=1)
+            while self._idle_count > self.max_open:
+                project_id, pooled = next(iter(self._idle.items()))
+                self._discard(pooled.pop(0))
+                if not pooled:
+                    del self._idle[project_id]
+                self.stats['evicted'] += 1
+    
+    def close_project(self, project_id: str):
+        """Close a project's idle connections, e.g. before its shard is removed"""
+        with self._lock:
+            for conn in self._idle.pop(project_id, []):
+                self._discard(conn)
+            self._ready.discard(project_id)
+    
+    def _discard(self, conn):
+        self._idle_count -= 1
+        _count_connections(pooled=-1)
+        conn.pool = None
+        conn.close()
+
+shard_pool = ShardPool(SHARD_DIRECTORY, MAX_OPEN_SHARDS)
+
+def get_connection(project_id: str = None):
+    """Get a database connection, to the project's shard under sharded storage"""
+    if SHARDED_STORAGE and project_id:
+        return shard_pool.connect(project_id)
+    conn = sqlite3.connect(DATABASE_FILE, factory=TrackedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _task_shard(task_id: str) -> Optional[str]:
+    """Get the project whose shard holds a task; None outside sharded storage"""
+    if not SHARDED_STORAGE:
+        return None
+    conn = get_connection()
+    row = conn.execute('SELECT project_id FROM task_shards WHERE task_id = ?', (task_id,)).fetchone()
+    conn.close()
+    return row['project_id'] if row else None
+
+def _shard_project_ids() -> List[str]:
+    """Get every project that has a shard; empty outside sharded storage"""
+    if not SHARDED_STORAGE:
+        return []
+    conn = get_connection()
+    rows = conn.execute('SELECT id FROM projects ORDER BY created_at').fetchall()
+    conn.close()
+    return [row['id'] for row in rows if os.path.exists(shard_pool.path(row['id']))]
+
+# Streaming reads
+# For responses too large to build in memory: rows are fetched a batch at a
+# time and handed out as they arrive. The connection stays open until the
+# generator is exhausted or closed.
+STREAM_BATCH_SIZE = 200
+
+def iter_rows(query: str, params: tuple = (), project_id: str = None,
+              batch_size: int = STREAM_BATCH_SIZE, convert=dict) -> Iterator[Dict]:
+    """Yield the rows of a query converted to dicts, fetching batch_size rows at a time
+    
+    Starlette may resume a streaming generator on a different worker thread
+    each time, so the connection is not tied to the thread that opened it.
+    """
+    if SHARDED_STORAGE and project_id:
+        conn = shard_pool.connect(project_id)
+    else:
+        conn = sqlite3.connect(DATABASE_FILE, factory=TrackedConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield convert(row)
+    finally:
+        conn.close()
+
 def init_database():
     """Initialize the database with required tables"""
     conn = get_connection()
@@ -1073,6 +1280,11 @@ def init_database():
             priority TEXT DEFAULT 'medium',
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
+            path TEXT,
+            rollup_start TEXT,
+            rollup_end TEXT,
+            rollup_progress REAL,
+            rollup_duration REAL,
             FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
             FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE
         )
@@ -1087,6 +1299,7 @@ def init_database():
             content TEXT NOT NULL,
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
+            revision INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
         )
     ''')
@@ -1113,7 +1326,16 @@ def init_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_project_id ON action_logs(project_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_task_id ON action_logs(task_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON action_logs(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_project_date ON project_notes(project_id, note_date)')
+    # One note per project and date; older databases get this from migrate.py v14,
+    # which merges duplicate notes first
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_project_date ON project_notes(project_id, note_date)')
+    
+    # A new database gets tasks.path above; older ones get it from migrate.py v10
+    cursor.execute('PRAGMA table_info(tasks)')
+    if 'path' in {row['name'] for row in cursor.fetchall()}:
+        create_task_path_triggers(cursor)
+    
+    create_app_settings(cursor)
     
     # Create default project if none exists
     cursor.execute('SELECT COUNT(*) FROM projects')
@@ -1129,11 +1351,55 @@ def init_database():
         cursor.execute('UPDATE tasks SET project_id = ? WHERE project_id IS NULL', (default_project_id,))
         cursor.execute('UPDATE action_logs SET project_id = ? WHERE project_id IS NULL', (default_project_id,))
     
+    # Move logs written before partitioning into their monthly tables
+    _partition_legacy_logs(cursor)
+    
     conn.commit()
     conn.close()
     
     print(f"✓ Database initialized: {DATABASE_FILE}")
 
+# App settings
+# Values every worker process must agree on: the secret that signs client
+# cookies, and projects_version, which triggers bump on any change to the
+# projects table so workers know when their cached project lookups are stale.
+def create_app_settings(cursor):
+    """Create the app_settings table and the triggers counting project changes"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('projects_version', '0')")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS projects_version_{event.lower()} AFTER {event} ON projects BEGIN
+                UPDATE app_settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'projects_version';
+            END
+        ''')
+
+def get_session_secret() -> str:
+    """Get the secret for signing client cookies, generated and stored on first use"""
+    conn = get_connection()
+    try:
+        # OR IGNORE: the first worker to store a secret wins and the others read it
+        conn.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('session_secret', ?)",
+                     (secrets.token_hex(32),))
+        conn.commit()
+        return conn.execute("SELECT value FROM app_settings WHERE key = 'session_secret'").fetchone()['value']
+    finally:
+        conn.close()
+
+def get_projects_version() -> int:
+    """Get the counter that goes up whenever any process changes a project"""
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT value FROM app_settings WHERE key = 'projects_version'").fetchone()
+        return int(row['value']) if row else 0
+    finally:
+        conn.close()
+
 # Project operations
 def create_project(project_data: Dict) -> Dict:
     """Create a new project"""
@@ -1241,10 +1507,20 @@ def delete_project(project_id: str) -> bool:
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+    affected = cursor.rowcount > 0
+    if SHARDED_STORAGE:
+        cursor.execute('DELETE FROM task_shards WHERE project_id = ?', (project_id,))
     
     conn.commit()
-    affected = cursor.rowcount > 0
     conn.close()
+    task_cache.invalidate(project_id)
+    
+    if SHARDED_STORAGE and affected:
+        shard_pool.close_project(project_id)
+        shard_file = shard_pool.path(project_id)
+        for path in (shard_file, shard_file + '-wal', shard_file + '-shm', shard_file + '-journal'):
+            if os.path.exists(path):
+                os.remove(path)
     return affected
 
 # Project notes operations
@@ -1269,6 +1545,45 @@ def create_note(note_data: Dict) -> Dict:
     conn.close()
     return note_data
 
+def save_note(note_id: str, project_id: str, note_date: str, content: str) -> Dict:
+    """Create a project's note for a date, or replace its content, in one statement
+    
+    Relies on the unique (project_id, note_date) index from migrate.py v14;
+    note_id is only used when the note is new. Group-committed.
+    """
+    # Buffered patches are older than this save, so write them first
+    note_buffer.flush()
+    now = datetime.now().isoformat()
+    
+    def write(cursor, buffered_revision):
+        # Kept above any patch buffered since the flush, which this save replaces
+        cursor.execute('''
+            INSERT INTO project_notes (id, project_id, note_date, content, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(project_id, note_date) DO UPDATE SET 
+                content = excluded.content,
+                revision = MAX(revision, ?) + 1,
+                updated_at = excluded.updated_at
+            RETURNING *
+        ''', (note_id, project_id, note_date, content, now, now, buffered_revision))
+        return dict(cursor.fetchone())
+    
+    return note_buffer.replace(lambda revision: group_commit.run(None, lambda cursor: write(cursor, revision)),
+                               project_id=project_id, note_date=note_date)
+
+def get_note_by_id(note_id: str) -> Optional[Dict]:
+    """Get a project note by ID"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT * FROM project_notes WHERE id = ?', (note_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if row:
+        return note_buffer.current(dict(row))
+    return None
+
 def get_note_by_date(project_id: str, note_date: str) -> Optional[Dict]:
     """Get a note for a specific project and date"""
     conn = get_connection()
@@ -1282,7 +1597,7 @@ def get_note_by_date(project_id: str, note_date: str) -> Optional[Dict]:
     conn.close()
     
     if row:
-        return dict(row)
+        return note_buffer.current(dict(row))
     return None
 
 def get_all_notes_for_project(project_id: str) -> List[Dict]:
@@ -1298,13 +1613,47 @@ def get_all_notes_for_project(project_id: str) -> List[Dict]:
     rows = cursor.fetchall()
     conn.close()
     
-    return [dict(row) for row in rows]
+    return [note_buffer.current(dict(row)) for row in rows]
 
-def update_note(note_id: str, updates: Dict) -> Optional[Dict]:
-    """Update a project note"""
+def iter_notes_for_project(project_id: str) -> Iterator[Dict]:
+    """Stream all notes for a project, newest first"""
+    return iter_rows('''
+        SELECT * FROM project_notes
+        WHERE project_id = ?
+        ORDER BY note_date DESC
+    ''', (project_id,), convert=lambda row: note_buffer.current(dict(row)))
+
+def iter_notes_for_export(project_id: str) -> Iterator[Dict]:
+    """Stream a project's notes oldest first, for export"""
+    return iter_rows('''
+        SELECT id, note_date, content, updated_at FROM project_notes
+        WHERE project_id = ?
+        ORDER BY note_date
+    ''', (project_id,), convert=lambda row: note_buffer.current(dict(row)))
+
+def get_note_dates(project_id: str, start_date: str, end_date: str) -> List[str]:
+    """Get the dates in [start_date, end_date] that have a note
+    
+    Only reads the (project_id, note_date) index, never the note bodies.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
+    cursor.execute('''
+        SELECT note_date FROM project_notes 
+        WHERE project_id = ? AND note_date BETWEEN ? AND ?
+        ORDER BY note_date
+    ''', (project_id, start_date, end_date))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return [row['note_date'] for row in rows]
+
+def update_note(note_id: str, updates: Dict) -> Optional[Dict]:
+    """Update a project note, group-committed and durable once this returns"""
+    # Buffered patches are older than this update, so write them first
+    note_buffer.flush()
+    
     set_clause = []
     values = []
     
@@ -1313,70 +1662,410 @@ def update_note(note_id: str, updates: Dict) -> Optional[Dict]:
             set_clause.append(f"{key} = ?")
             values.append(value)
     
+    # Kept above any patch buffered since the flush, which this update replaces
+    set_clause.append("revision = MAX(revision, ?) + 1")
     set_clause.append("updated_at = ?")
-    values.append(datetime.now().isoformat())
-    values.append(note_id)
-    
     query = f"UPDATE project_notes SET {', '.join(set_clause)} WHERE id = ?"
-    cursor.execute(query, values)
     
-    conn.commit()
-    conn.close()
+    def write(cursor, buffered_revision):
+        cursor.execute(query, values + [buffered_revision, datetime.now().isoformat(), note_id])
+        cursor.execute('SELECT * FROM project_notes WHERE id = ?', (note_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
     
-    cursor.execute('SELECT * FROM project_notes WHERE id = ?', (note_id,))
-    row = cursor.fetchone()
-    return dict(row) if row else None
+    return note_buffer.replace(lambda revision: group_commit.run(None, lambda cursor: write(cursor, revision)),
+                               note_id=note_id)
 
 def delete_note(note_id: str) -> bool:
     """Delete a project note"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM project_notes WHERE id = ?', (note_id,))
-    
-    conn.commit()
-    affected = cursor.rowcount > 0
-    conn.close()
-    return affected
+    def delete(buffered_revision):
+        conn = get_connection()
+        try:
+            cursor = conn.execute('DELETE FROM project_notes WHERE id = ?', (note_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+    
+    return note_buffer.replace(delete, note_id=note_id)
+
+# Note patches
+# The note editor sends text patches against the revision it last saw rather
+# than the whole note. Patched notes are held in memory and written once
+# NOTE_FLUSH_DELAY seconds pass without another patch, or NOTE_FLUSH_MAX_DELAY
+# after the first unsaved one, so a burst of typing costs a single write. Note
+# reads return the buffered copy of a note with unsaved patches rather than
+# waiting on a flush; only search, which reads the FTS index, flushes first.
+# Buffered writes are conditional on the revision last saved, so they never
+# overwrite a PUT or save made meanwhile; those go through
+# NotePatchBuffer.replace. Patch offsets count UTF-16 code units, as
+# JavaScript string indexes do.
+NOTE_FLUSH_DELAY = 1.0
+NOTE_FLUSH_MAX_DELAY = 5.0
+
+class NoteConflict(Exception):
+    """A patch was made against a revision of the note that is no longer current"""
+    def __init__(self, note: Dict):
+        super().__init__(f"Note {note['id']} is at revision {note['revision']}")
+        self.note = note
+
+def apply_text_patches(content: str, patches: List[Dict]) -> str:
+    """Apply {start, end, text} replacements in order, each against the previous result"""
+    units = content.encode('utf-16-le')
+    for patch in patches:
+        start, end = patch['start'], patch['end']
+        if not 0 <= start <= end <= len(units) // 2:
+            raise ValueError(f"Patch range {start}-{end} is outside the note")
+        units = units[:start * 2] + patch['text'].encode('utf-16-le') + units[end * 2:]
+    try:
+        return units.decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise ValueError("Patch splits a character")
+
+class NotePatchBuffer:
+    """In-memory notes with unsaved patches, written back after a quiet period"""
+    def __init__(self, delay: float, max_delay: float):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.stats = {'patches': 0, 'writes': 0, 'conflicts': 0, 'superseded': 0}
+        self._notes = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def pending(self) -> int:
+        """Number of notes with patches not yet written"""
+        return sum(1 for entry in self._notes.values() if entry['note']['revision'] != entry['saved_revision'])
+    
+    def start(self):
+        """Start the background writer thread"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='note-writer', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the writer thread and write every unsaved note"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def patch(self, note_id: str, base_revision: int, patches: List[Dict]) -> Optional[Dict]:
+        """Apply patches made against base_revision and return the patched note
+        
+        Raises NoteConflict if the note has moved past base_revision and
+        ValueError for a patch that doesn't fit the note. Returns None if
+        the note doesn't exist.
+        """
+        with self._lock:
+            entry = self._notes.get(note_id)
+            if entry is None:
+                conn = get_connection()
+                row = conn.execute('SELECT * FROM project_notes WHERE id = ?', (note_id,)).fetchone()
+                conn.close()
+                if not row:
+                    return None
+                entry = {'note': dict(row), 'saved_revision': row['revision'], 'first_patch': None, 'last_patch': None}
+                self._notes[note_id] = entry
+            
+            note = entry['note']
+            if note['revision'] != base_revision:
+                self.stats['conflicts'] += 1
+                raise NoteConflict(dict(note))
+            
+            content = apply_text_patches(note['content'], patches)
+            now = time.monotonic()
+            note['content'] = content
+            note['revision'] += 1
+            note['updated_at'] = datetime.now().isoformat()
+            entry['first_patch'] = entry['first_patch'] or now
+            entry['last_patch'] = now
+            self.stats['patches'] += 1
+            
+            if not self.running:
+                due = [note_id]
+            else:
+                due = []
+        
+        if due:
+            self.flush(due)
+        return dict(note)
+    
+    def flush(self, note_ids: List[str] = None) -> int:
+        """Write unsaved notes, all of them or just note_ids, in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch = [
+                    (entry['note']['content'], entry['note']['revision'], entry['note']['updated_at'],
+                     note_id, entry['saved_revision'])
+                    for note_id, entry in self._notes.items()
+                    if entry['note']['revision'] != entry['saved_revision'] and (note_ids is None or note_id in note_ids)
+                ]
+            
+            if not batch:
+                return 0
+            
+            def write(cursor):
+                superseded = []
+                for row in batch:
+                    cursor.execute('''
+                        UPDATE project_notes SET content = ?, revision = ?, updated_at = ?
+                        WHERE id = ? AND revision = ?
+                    ''', row)
+                    if cursor.rowcount == 0:
+                        superseded.append(row[3])
+                return superseded
+            
+            superseded = group_commit.run(None, write)
+            
+            with self._lock:
+                for _, revision, _, note_id, saved_revision in batch:
+                    entry = self._notes.get(note_id)
+                    if entry is None or entry['saved_revision'] != saved_revision:
+                        continue
+                    if note_id in superseded:
+                        # Changed or deleted elsewhere; its patches were made against a stale copy
+                        del self._notes[note_id]
+                        self.stats['superseded'] += 1
+                        continue
+                    entry['saved_revision'] = revision
+                    if entry['note']['revision'] == revision:
+                        entry['first_patch'] = None
+            self.stats['writes'] += 1
+            return len(batch) - len(superseded)
+    
+    def current(self, note: Dict) -> Dict:
+        """A note row read from the database, with the same columns taken from its buffered copy"""
+        with self._lock:
+            entry = self._notes.get(note['id'])
+            if entry is None:
+                return note
+            return {key: entry['note'][key] for key in note}
+    
+    def replace(self, write, note_id: str = None, project_id: str = None, note_date: str = None):
+        """Run write(buffered_revision) to replace or delete a note, then drop its buffered copy
+        
+        The note is picked by note_id, or by project_id and note_date. The
+        buffer stays locked throughout, so no patch can be accepted against
+        the old note in between. buffered_revision is the buffered copy's
+        revision, or 0.
+        """
+        with self._lock:
+            if note_id is None:
+                note_id = next((buffered_id for buffered_id, entry in self._notes.items()
+                                if entry['note']['project_id'] == project_id
+                                and entry['note']['note_date'] == note_date), None)
+            entry = self._notes.get(note_id)
+            result = write(entry['note']['revision'] if entry else 0)
+            self._notes.pop(note_id, None)
+            return result
+    
+    def _due(self) -> List[str]:
+        """Notes whose editing has paused long enough to write, dropping idle saved ones"""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for note_id, entry in list(self._notes.items()):
+                idle = now - entry['last_patch'] >= self.delay
+                if entry['note']['revision'] == entry['saved_revision']:
+                    if idle:
+                        del self._notes[note_id]
+                elif idle or now - entry['first_patch'] >= self.max_delay:
+                    due.append(note_id)
+        return due
+    
+    def _run(self):
+        while not self._stopping.wait(self.delay / 4):
+            due = self._due()
+            if due:
+                try:
+                    self.flush(due)
+                except sqlite3.Error as e:
+                    print(f"✗ Failed to write notes: {e}")
+
+note_buffer = NotePatchBuffer(NOTE_FLUSH_DELAY, NOTE_FLUSH_MAX_DELAY)
+
+# Task cache
+# Decoded task lists are cached per project and kept current by the task writers
+# below, so repeated reads of a project skip SQLite. Whole projects are evicted
+# least recently used once more than TASK_CACHE_MAX_TASKS tasks are held.
+# Every committed write bumps its project's generation, cached or not, and a
+# list read on a miss is only cached if no write committed while it was read.
+TASK_CACHE_MAX_TASKS = 50000
+
+class TaskCache:
+    """LRU cache of each project's decoded tasks, in created_at order"""
+    def __init__(self, max_tasks: int):
+        self.max_tasks = max_tasks
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'stale_loads': 0}
+        self._projects = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def size(self) -> int:
+        """Number of tasks held across all cached projects"""
+        return self._size
+    
+    def contains(self, project_id: str) -> bool:
+        return project_id in self._projects
+    
+    def get(self, project_id: str) -> Optional[List[Dict]]:
+        """Get copies of a project's cached tasks, or None on a miss"""
+        with self._lock:
+            tasks = self._projects.get(project_id)
+            if tasks is None:
+                self.stats['misses'] += 1
+                return None
+            self._projects.move_to_end(project_id)
+            self.stats['hits'] += 1
+            return [dict(task) for task in tasks.values()]
+    
+    def generation(self, project_id: str) -> tuple:
+        """Get a project's write generation; take it before reading tasks to load()"""
+        with self._lock:
+            return self._epoch, self._generations.get(project_id, 0)
+    
+    def bump(self, project_id: str):
+        """Record a committed write to a project, whether or not it is cached"""
+        with self._lock:
+            self._generations[project_id] = self._generations.get(project_id, 0) + 1
+    
+    def load(self, project_id: str, tasks: List[Dict], generation: tuple) -> bool:
+        """Cache a project's full task list, evicting older projects if needed
+        
+        Tasks read before a write that has since committed are not cached.
+        """
+        with self._lock:
+            if generation != (self._epoch, self._generations.get(project_id, 0)):
+                self.stats['stale_loads'] += 1
+                return False
+            self._drop(project_id)
+            self._projects[project_id] = {task['id']: dict(task) for task in tasks}
+            self._size += len(tasks)
+            while self._size > self.max_tasks and len(self._projects) > 1:
+                self._drop(next(iter(self._projects)))
+                self.stats['evictions'] += 1
+            return True
+    
+    def upsert(self, project_id: str, tasks: List[Dict]):
+        """Write changed tasks through to a cached project"""
+        with self._lock:
+            cached = self._projects.get(project_id)
+            if cached is None:
+                return
+            for task in tasks:
+                if task['id'] not in cached:
+                    self._size += 1
+                cached[task['id']] = dict(task)
+    
+    def remove(self, project_id: str, task_ids):
+        """Drop deleted tasks from a cached project"""
+        with self._lock:
+            cached = self._projects.get(project_id)
+            if cached is None:
+                return
+            for task_id in task_ids:
+                if cached.pop(task_id, None) is not None:
+                    self._size -= 1
+    
+    def invalidate(self, project_id: str = None):
+        """Forget one project's tasks, or every project's"""
+        with self._lock:
+            if project_id is None:
+                self._projects.clear()
+                self._size = 0
+                self._epoch += 1
+            else:
+                self._drop(project_id)
+                self._generations[project_id] = self._generations.get(project_id, 0) + 1
+    
+    def _drop(self, project_id: str):
+        tasks = self._projects.pop(project_id, None)
+        if tasks is not None:
+            self._size -= len(tasks)
+
+task_cache = TaskCache(TASK_CACHE_MAX_TASKS)
+
+def _write_through_tasks(cursor, project_id: str, task_ids):
+    """Refresh the cached copies of tasks changed by a committed write"""
+    task_cache.bump(project_id)
+    task_ids = list(set(task_ids))
+    if not task_ids or not task_cache.contains(project_id):
+        return
+    placeholders = ','.join('?' * len(task_ids))
+    cursor.execute(f'SELECT * FROM tasks WHERE id IN ({placeholders})', task_ids)
+    task_cache.upsert(project_id, [row_to_task_dict(row) for row in cursor.fetchall()])
 
 # Task operations (updated to include project_id)
 def create_task(task_data: Dict) -> Dict:
     """Create a new task in the database"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO tasks (
-            id, project_id, name, start_date, end_date, progress, color, dependencies,
-            is_milestone, parent_id, description, assigned_to, priority,
-            created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        task_data['id'],
-        task_data['project_id'],
-        task_data['name'],
-        task_data['start_date'],
-        task_data['end_date'],
-        task_data['progress'],
-        task_data['color'],
-        json.dumps(task_data['dependencies']),
-        1 if task_data['is_milestone'] else 0,
-        task_data.get('parent_id'),
-        task_data.get('description'),
-        task_data.get('assigned_to'),
-        task_data['priority'],
-        task_data['created_at'],
-        task_data['updated_at']
-    ))
-    
-    conn.commit()
+    mapped = False
+    if SHARDED_STORAGE:
+        # Mapped first so the task can be found as soon as its shard commits
+        conn = get_connection()
+        mapped = conn.execute('INSERT OR IGNORE INTO task_shards (task_id, project_id) VALUES (?, ?)',
+                              (task_data['id'], task_data['project_id'])).rowcount > 0
+        conn.commit()
+        conn.close()
+    
+    conn = get_connection(task_data['project_id'])
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO tasks (
+                id, project_id, name, start_date, end_date, progress, color, dependencies,
+                is_milestone, parent_id, description, assigned_to, priority,
+                created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            task_data['id'],
+            task_data['project_id'],
+            task_data['name'],
+            task_data['start_date'],
+            task_data['end_date'],
+            task_data['progress'],
+            task_data['color'],
+            json.dumps(task_data['dependencies']),
+            1 if task_data['is_milestone'] else 0,
+            task_data.get('parent_id'),
+            task_data.get('description'),
+            task_data.get('assigned_to'),
+            task_data['priority'],
+            task_data['created_at'],
+            task_data['updated_at']
+        ))
+        changed_ids = _propagate_rollups(cursor, task_data['id'])
+        
+        conn.commit()
+    except Exception:
+        conn.close()
+        if mapped:
+            # The task never reached its shard, so don't leave a mapping to it
+            catalog = get_connection()
+            catalog.execute('DELETE FROM task_shards WHERE task_id = ?', (task_data['id'],))
+            catalog.commit()
+            catalog.close()
+        raise
+    
+    _write_through_tasks(cursor, task_data['project_id'], changed_ids)
     conn.close()
     
     return task_data
 
 def get_task_by_id(task_id: str) -> Optional[Dict]:
     """Get a single task by ID"""
-    conn = get_connection()
+    conn = get_connection(_task_shard(task_id))
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
@@ -1389,7 +2078,16 @@ def get_task_by_id(task_id: str) -> Optional[Dict]:
 
 def get_all_tasks(project_id: str = None) -> List[Dict]:
     """Get all tasks, optionally filtered by project"""
-    conn = get_connection()
+    if project_id:
+        cached = task_cache.get(project_id)
+        if cached is not None:
+            return cached
+    elif SHARDED_STORAGE:
+        tasks = [task for shard_id in _shard_project_ids() for task in get_all_tasks(shard_id)]
+        return sorted(tasks, key=lambda task: task['created_at'])
+    
+    generation = task_cache.generation(project_id) if project_id else None
+    conn = get_connection(project_id)
     cursor = conn.cursor()
     
     if project_id:
@@ -1400,13 +2098,207 @@ def get_all_tasks(project_id: str = None) -> List[Dict]:
     rows = cursor.fetchall()
     conn.close()
     
+    tasks = [row_to_task_dict(row) for row in rows]
+    if project_id:
+        task_cache.load(project_id, tasks, generation)
+    return tasks
+
+def iter_tasks(project_id: str) -> Iterator[Dict]:
+    """Stream a project's tasks in creation order, from the cache when it is loaded"""
+    cached = task_cache.get(project_id)
+    if cached is not None:
+        return iter(cached)
+    return iter_rows('SELECT * FROM tasks WHERE project_id = ? ORDER BY created_at',
+                     (project_id,), project_id, convert=row_to_task_dict)
+
+# Sortable columns for query_tasks; priority sorts by rank rather than name
+TASK_SORT_COLUMNS = {
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'name': 'name',
+    'progress': 'progress',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'priority': "CASE priority WHEN 'critical' THEN 4 WHEN 'high' THEN 3 WHEN 'medium' THEN 2 WHEN 'low' THEN 1 ELSE 0 END"
+}
+
+def query_tasks(project_id: str, window_start: str = None, window_end: str = None,
+                assigned_to: str = None, priorities: List[str] = None,
+                min_progress: float = None, max_progress: float = None,
+                is_milestone: bool = None, subtree_of: str = None,
+                sort_by: str = 'start_date', descending: bool = False,
+                limit: int = 500, offset: int = 0) -> List[Dict]:
+    """Get a filtered, sorted page of a project's tasks
+    
+    The date window matches tasks overlapping [window_start, window_end].
+    subtree_of limits results to the descendants of that task.
+    """
+    if sort_by not in TASK_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort tasks by '{sort_by}'")
+    
+    conn = get_connection(project_id)
+    cursor = conn.cursor()
+    
+    where = ['project_id = ?']
+    params = [project_id]
+    
+    if subtree_of:
+        bounds = _subtree_bounds(cursor, subtree_of)
+        if bounds is None:
+            conn.close()
+            return []
+        # Strictly inside the range excludes the subtree root itself
+        where.append('path > ? AND path < ?')
+        params.extend(bounds)
+    if window_end:
+        where.append('start_date <= ?')
+        params.append(window_end)
+    if window_start:
+        where.append('end_date >= ?')
+        params.append(window_start)
+    if assigned_to is not None:
+        where.append('assigned_to = ?')
+        params.append(assigned_to)
+    if priorities:
+        where.append(f"priority IN ({','.join('?' * len(priorities))})")
+        params.extend(priorities)
+    if min_progress is not None:
+        where.append('progress >= ?')
+        params.append(min_progress)
+    if max_progress is not None:
+        where.append('progress <= ?')
+        params.append(max_progress)
+    if is_milestone is not None:
+        where.append('is_milestone = ?')
+        params.append(1 if is_milestone else 0)
+    
+    direction = 'DESC' if descending else 'ASC'
+    cursor.execute(f'''
+        SELECT * FROM tasks 
+        WHERE {' AND '.join(where)}
+        ORDER BY {TASK_SORT_COLUMNS[sort_by]} {direction}, created_at 
+        LIMIT ? OFFSET ?
+    ''', params + [limit, offset])
+    
+    rows = cursor.fetchall()
+    conn.close()
+    
     return [row_to_task_dict(row) for row in rows]
 
-def update_task(task_id: str, updates: Dict) -> Optional[Dict]:
-    """Update a task in the database"""
-    conn = get_connection()
+def get_tasks_in_window(project_id: str, window_start: str, window_end: str) -> List[Dict]:
+    """Get a project's tasks overlapping [window_start, window_end]
+    
+    Uses the task_intervals R*Tree (created by migrate.py v9), which
+    stores each task's dates as day numbers and is kept current by triggers.
+    """
+    conn = get_connection(project_id)
     cursor = conn.cursor()
     
+    cursor.execute('''
+        SELECT t.* FROM task_intervals r
+        JOIN tasks t ON t.rowid = r.id
+        WHERE r.start_day <= CAST(julianday(?) - 2440587.5 AS INTEGER)
+          AND r.end_day >= CAST(julianday(?) - 2440587.5 AS INTEGER)
+          AND r.project_id = ?
+        ORDER BY t.start_date, t.created_at
+    ''', (window_end, window_start, project_id))
+    
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return [row_to_task_dict(row) for row in rows]
+
+# Task hierarchy: tasks.path (created by init_database, or added by migrate.py
+# v10) is '/<root id>/.../<id>/' and is maintained by triggers on insert and
+# reparent, so a task's subtree is the index range [path, path[:-1] + '0');
+# '0' sorts directly after '/'.
+TASK_PATH_UPPER_SQL = "substr({0}, 1, length({0}) - 1) || '0'"
+
+def create_task_path_triggers(cursor):
+    """Create the tasks.path index and the triggers that keep paths current"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_path ON tasks(path)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS task_paths_ai AFTER INSERT ON tasks BEGIN
+            UPDATE tasks SET path = COALESCE((SELECT path FROM tasks WHERE id = new.parent_id), '/') || new.id || '/'
+            WHERE id = new.id;
+        END
+    ''')
+    # Reparenting rewrites the moved task's path prefix across its whole subtree
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_paths_au AFTER UPDATE OF parent_id ON tasks
+        WHEN new.parent_id IS NOT old.parent_id BEGIN
+            UPDATE tasks 
+            SET path = COALESCE((SELECT path FROM tasks WHERE id = new.parent_id), '/') || new.id || '/' ||
+                       substr(path, length(old.path) + 1)
+            WHERE path >= old.path AND path < {TASK_PATH_UPPER_SQL.format('old.path')};
+        END
+    ''')
+
+def _subtree_bounds(cursor, task_id: str) -> Optional[tuple]:
+    """Get the path range covering a task and all of its descendants, None if it doesn't exist"""
+    cursor.execute('SELECT path FROM tasks WHERE id = ?', (task_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if not row['path']:
+        raise sqlite3.DatabaseError(f"Task {task_id} has no path; run migrate.py to compute task paths")
+    return row['path'], row['path'][:-1] + '0'
+
+def is_in_subtree(task_id: str, root_id: str) -> bool:
+    """Check whether a task is root_id itself or one of its descendants"""
+    conn = get_connection(_task_shard(root_id))
+    cursor = conn.cursor()
+    
+    bounds = _subtree_bounds(cursor, root_id)
+    cursor.execute('SELECT path FROM tasks WHERE id = ?', (task_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    return bool(bounds and row and row['path'] and bounds[0] <= row['path'] < bounds[1])
+
+# Roll-up columns (created by init_database, or added by migrate.py v11)
+# summarize each task's subtree: the earliest start and latest end of the task
+# and its descendants, and progress weighted by duration over leaf tasks, whose
+# total duration is rollup_duration. A task's roll-up is computed from its own
+# fields and its children's roll-ups.
+ROLLUP_SOURCE_FIELDS = {'start_date', 'end_date', 'progress', 'parent_id'}
+ROLLUP_UPDATE_SQL = '''
+    UPDATE tasks SET
+        rollup_start = MIN(start_date, COALESCE(
+            (SELECT MIN(c.rollup_start) FROM tasks c WHERE c.parent_id = tasks.id), start_date)),
+        rollup_end = MAX(end_date, COALESCE(
+            (SELECT MAX(c.rollup_end) FROM tasks c WHERE c.parent_id = tasks.id), end_date)),
+        rollup_duration = COALESCE(
+            (SELECT SUM(c.rollup_duration) FROM tasks c WHERE c.parent_id = tasks.id),
+            MAX(julianday(end_date) - julianday(start_date) + 1, 1)),
+        rollup_progress = COALESCE(
+            (SELECT SUM(c.rollup_progress * c.rollup_duration) / SUM(c.rollup_duration)
+             FROM tasks c WHERE c.parent_id = tasks.id), progress)
+    WHERE {where}
+'''
+
+def _propagate_rollups(cursor, task_id: Optional[str]) -> List[str]:
+    """Recompute roll-ups for a task and then each of its ancestors, bottom up
+    
+    Returns the ids of the tasks that were recomputed.
+    """
+    if not task_id:
+        return []
+    cursor.execute('SELECT path FROM tasks WHERE id = ?', (task_id,))
+    row = cursor.fetchone()
+    if not row or not row['path']:
+        return []
+    
+    chain = list(reversed(row['path'].strip('/').split('/')))
+    for ancestor_id in chain:
+        cursor.execute(ROLLUP_UPDATE_SQL.format(where='id = ?'), (ancestor_id,))
+    return chain
+
+def update_task(task_id: str, updates: Dict) -> Optional[Dict]:
+    """Update a task in the database
+    
+    The write is group-committed and durable once this returns.
+    """
     set_clause = []
     values = []
     
@@ -1424,50 +2316,78 @@ def update_task(task_id: str, updates: Dict) -> Optional[Dict]:
     set_clause.append("updated_at = ?")
     values.append(datetime.now().isoformat())
     values.append(task_id)
-    
     query = f"UPDATE tasks SET {', '.join(set_clause)} WHERE id = ?"
-    cursor.execute(query, values)
-    
-    conn.commit()
-    conn.close()
     
+    def write(cursor):
+        cursor.execute('SELECT project_id, parent_id FROM tasks WHERE id = ?', (task_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        
+        cursor.execute(query, values)
+        
+        changed_ids = [task_id]
+        if ROLLUP_SOURCE_FIELDS.intersection(updates):
+            changed_ids += _propagate_rollups(cursor, task_id)
+            if 'parent_id' in updates and updates['parent_id'] != row['parent_id']:
+                changed_ids += _propagate_rollups(cursor, row['parent_id'])
+        return row['project_id'], changed_ids
+    
+    def after_commit(cursor, written):
+        if written:
+            _write_through_tasks(cursor, *written)
+    
+    if group_commit.run(_task_shard(task_id), write, after_commit) is None:
+        return None
     return get_task_by_id(task_id)
 
 def delete_task(task_id: str) -> bool:
-    """Delete a task and its subtasks from the database"""
-    conn = get_connection()
+    """Delete a task and its subtasks from the database
+    
+    Under sharded storage the task_shards rows are kept, so the history of
+    deleted tasks can still be read.
+    """
+    conn = get_connection(_task_shard(task_id))
     cursor = conn.cursor()
     
-    def get_all_subtask_ids(parent_id):
-        cursor.execute('SELECT id FROM tasks WHERE parent_id = ?', (parent_id,))
-        subtask_ids = [row['id'] for row in cursor.fetchall()]
-        all_ids = subtask_ids.copy()
-        for subtask_id in subtask_ids:
-            all_ids.extend(get_all_subtask_ids(subtask_id))
-        return all_ids
+    bounds = _subtree_bounds(cursor, task_id)
+    if bounds is None:
+        conn.close()
+        return False
     
-    task_ids_to_delete = [task_id] + get_all_subtask_ids(task_id)
+    cursor.execute('SELECT project_id, parent_id FROM tasks WHERE id = ?', (task_id,))
+    task_row = cursor.fetchone()
+    cursor.execute('SELECT id FROM tasks WHERE path >= ? AND path < ?', bounds)
+    task_ids_to_delete = {row['id'] for row in cursor.fetchall()}
     
-    cursor.execute('SELECT id, dependencies FROM tasks')
+    # Dependents may belong to other projects; their cached copies are refreshed under their own
+    changed_ids = {task_row['project_id']: []}
+    cursor.execute('SELECT id, project_id, dependencies FROM tasks')
     for row in cursor.fetchall():
         deps = json.loads(row['dependencies'])
         updated_deps = [d for d in deps if d not in task_ids_to_delete]
         if len(updated_deps) != len(deps):
             cursor.execute('UPDATE tasks SET dependencies = ? WHERE id = ?',
                          (json.dumps(updated_deps), row['id']))
+            if row['id'] not in task_ids_to_delete:
+                changed_ids.setdefault(row['project_id'], []).append(row['id'])
     
-    placeholders = ','.join('?' * len(task_ids_to_delete))
-    cursor.execute(f'DELETE FROM tasks WHERE id IN ({placeholders})', task_ids_to_delete)
+    cursor.execute('DELETE FROM tasks WHERE path >= ? AND path < ?', bounds)
+    affected = cursor.rowcount > 0
+    changed_ids[task_row['project_id']] += _propagate_rollups(cursor, task_row['parent_id'])
     
     conn.commit()
-    affected = cursor.rowcount > 0
+    # Bump the generation before removing, so a list read before the delete can't be cached after it
+    for project_id, project_changed_ids in changed_ids.items():
+        _write_through_tasks(cursor, project_id, project_changed_ids)
+    task_cache.remove(task_row['project_id'], task_ids_to_delete)
     conn.close()
     
     return affected
 
 def get_subtasks(parent_id: str) -> List[Dict]:
     """Get all direct subtasks of a parent task"""
-    conn = get_connection()
+    conn = get_connection(_task_shard(parent_id))
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM tasks WHERE parent_id = ? ORDER BY created_at', (parent_id,))
@@ -1476,84 +2396,810 @@ def get_subtasks(parent_id: str) -> List[Dict]:
     
     return [row_to_task_dict(row) for row in rows]
 
-# Action log operations (updated to include project_id)
-def create_log(log_data: Dict) -> Dict:
-    """Create a new action log entry"""
-    conn = get_connection()
+def get_task_tree_level(project_id: str, parent_id: Optional[str] = None) -> List[Dict]:
+    """Get one level of a project's task tree with child and descendant counts
+    
+    parent_id None returns the root tasks. Subtree roll-ups come with every
+    task; descendant_count is a path range scan.
+    """
+    conn = get_connection(project_id)
     cursor = conn.cursor()
     
     cursor.execute('''
-        INSERT INTO action_logs (id, project_id, action, task_id, task_name, timestamp, details, user)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        log_data['id'],
-        log_data['project_id'],
-        log_data['action'],
-        log_data['task_id'],
-        log_data['task_name'],
-        log_data['timestamp'],
-        json.dumps(log_data['details']),
-        log_data.get('user', 'system')
-    ))
+        SELECT t.*,
+               (SELECT COUNT(*) FROM tasks c WHERE c.parent_id = t.id) AS child_count,
+               (SELECT COUNT(*) FROM tasks d
+                WHERE d.path > t.path AND d.path < substr(t.path, 1, length(t.path) - 1) || '0') AS descendant_count
+        FROM tasks t
+        WHERE t.project_id = ? AND t.parent_id IS ?
+        ORDER BY t.created_at
+    ''', (project_id, parent_id))
     
-    conn.commit()
+    rows = cursor.fetchall()
     conn.close()
     
+    return [{
+        **row_to_task_dict(row),
+        'child_count': row['child_count'],
+        'descendant_count': row['descendant_count']
+    } for row in rows]
+
+# Action log operations
+# Logs are stored in one table per month (action_logs_YYYY_MM) so retention can
+# drop whole months and recent-log reads only touch the newest partitions. The
+# original action_logs table is kept empty; init_database() moves any rows
+# found there into their partitions.
+LOG_PARTITION_PREFIX = 'action_logs_'
+DEFAULT_LOG_RETENTION_DAYS = 90
+
+def log_partition_name(timestamp: str) -> str:
+    """Get the partition table holding logs written at an ISO timestamp"""
+    return f"{LOG_PARTITION_PREFIX}{timestamp[:4]}_{timestamp[5:7]}"
+
+def ensure_log_partition(cursor, table: str):
+    """Create a monthly log partition and its indexes if they don't exist"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            task_id TEXT NOT NULL,
+            task_name TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            details TEXT NOT NULL,
+            user TEXT DEFAULT 'system'
+        )
+    ''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_project_ts_id ON {table}(project_id, timestamp, id)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_task_ts_id ON {table}(task_id, timestamp, id)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)')
+
+def list_log_partitions(cursor) -> List[str]:
+    """Get the names of all log partitions, newest first"""
+    cursor.execute('''
+        SELECT name FROM sqlite_master 
+        WHERE type = 'table' AND name GLOB 'action_logs_[0-9][0-9][0-9][0-9]_[0-9][0-9]'
+        ORDER BY name DESC
+    ''')
+    return [row['name'] for row in cursor.fetchall()]
+
+def _partition_legacy_logs(cursor) -> int:
+    """Move rows from the unpartitioned action_logs table into monthly partitions"""
+    cursor.execute('SELECT DISTINCT substr(timestamp, 1, 7) AS month FROM action_logs')
+    months = [row['month'] for row in cursor.fetchall()]
+    
+    moved = 0
+    for month in months:
+        table = log_partition_name(month)
+        ensure_log_partition(cursor, table)
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO {table} (id, project_id, action, task_id, task_name, timestamp, details, user)
+            SELECT id, project_id, action, task_id, task_name, timestamp, details, user 
+            FROM action_logs WHERE substr(timestamp, 1, 7) = ?
+        ''', (month,))
+        moved += cursor.rowcount
+    
+    if months:
+        cursor.execute('DELETE FROM action_logs')
+    return moved
+
+def _select_log_partitions(cursor, where: str, params: tuple, order: str) -> List:
+    """Run the same filtered SELECT over every log partition as one UNION ALL"""
+    partitions = list_log_partitions(cursor)
+    if not partitions:
+        return []
+    
+    query = ' UNION ALL '.join(f'SELECT * FROM {table} WHERE {where}' for table in partitions)
+    cursor.execute(f'{query} ORDER BY {order}', params * len(partitions))
+    return cursor.fetchall()
+
+def create_log(log_data: Dict) -> Dict:
+    """Create a new action log entry"""
+    create_logs([log_data])
     return log_data
 
-def get_logs(project_id: str = None, limit: int = 50) -> List[Dict]:
-    """Get recent action logs, optionally filtered by project"""
-    conn = get_connection()
+def create_logs(logs: List[Dict]) -> int:
+    """Insert a batch of action log entries, one transaction per database"""
+    by_shard = {}
+    for log_data in logs:
+        shard_id = log_data['project_id'] if SHARDED_STORAGE else None
+        by_shard.setdefault(shard_id, []).append(log_data)
+    
+    for shard_id, shard_logs in by_shard.items():
+        conn = get_connection(shard_id)
+        try:
+            cursor = conn.cursor()
+            
+            by_partition = {}
+            for log_data in shard_logs:
+                by_partition.setdefault(log_partition_name(log_data['timestamp']), []).append(log_data)
+            
+            for table, partition_logs in by_partition.items():
+                ensure_log_partition(cursor, table)
+                # OR IGNORE: a batch retried after a partial failure skips what was written
+                cursor.executemany(f'''
+                    INSERT OR IGNORE INTO {table} (id, project_id, action, task_id, task_name, timestamp, details, user)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(
+                    log_data['id'],
+                    log_data['project_id'],
+                    log_data['action'],
+                    log_data['task_id'],
+                    log_data['task_name'],
+                    log_data['timestamp'],
+                    encode_log_details(log_data['details']),
+                    log_data.get('user', 'system')
+                ) for log_data in partition_logs])
+            
+            conn.commit()
+        finally:
+            conn.close()
+    
+    return len(logs)
+
+def _get_log_page(cursor, column: str, value: Optional[str], limit: int, before: Optional[tuple]) -> List:
+    """Get up to limit log rows older than a (timestamp, id) cursor, newest first
+    
+    Each partition is read with a keyset condition on its (column, timestamp, id)
+    index, newest partition first, so the cost is proportional to the page.
+    """
+    rows = []
+    for table in list_log_partitions(cursor):
+        remaining = limit - len(rows)
+        if remaining <= 0:
+            break
+        if before and table > log_partition_name(before[0]):
+            continue
+        
+        where = []
+        params = []
+        if value is not None:
+            where.append(f'{column} = ?')
+            params.append(value)
+        if before:
+            where.append('(timestamp, id) < (?, ?)')
+            params.extend(before)
+        where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+        
+        cursor.execute(f'''
+            SELECT * FROM {table} 
+            {where_clause}
+            ORDER BY timestamp DESC, id DESC 
+            LIMIT ?
+        ''', params + [remaining])
+        rows.extend(cursor.fetchall())
+    
+    return rows
+
+def get_logs(project_id: str = None, limit: int = 50, expand: bool = False, before: Optional[tuple] = None) -> List[Dict]:
+    """Get recent action logs, optionally filtered by project
+    
+    Logs are returned oldest first. Pass the (timestamp, id) of the oldest
+    entry of a page as before to get the page preceding it. With
+    expand=True, compact UPDATE/DELETE entries are rebuilt into full task
+    views by replaying the history of the tasks on the page.
+    Under sharded storage a project is required to find any logs.
+    """
+    log_queue.flush()
+    conn = get_connection(project_id)
     cursor = conn.cursor()
     
-    if project_id:
-        cursor.execute('''
-            SELECT * FROM action_logs 
-            WHERE project_id = ?
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (project_id, limit))
+    rows = _get_log_page(cursor, 'project_id', project_id, limit, before)
+    logs = [row_to_log_dict(row) for row in reversed(rows)]
+    
+    if expand and logs:
+        expanded = {log['id']: log for log in _get_expanded_history(cursor, logs)}
+        logs = [expanded.get(log['id'], log) for log in logs]
+    
+    conn.close()
+    return logs
+
+def iter_logs(project_id: str) -> Iterator[Dict]:
+    """Stream a project's whole log history oldest first, without expanding entries"""
+    log_queue.flush()
+    conn = get_connection(project_id)
+    partitions = list_log_partitions(conn.cursor())
+    conn.close()
+    
+    for table in reversed(partitions):
+        yield from iter_rows(f'SELECT * FROM {table} WHERE project_id = ? ORDER BY timestamp, id',
+                             (project_id,), project_id, convert=row_to_log_dict)
+
+def get_task_logs(task_id: str, expand: bool = False, limit: int = None, before: Optional[tuple] = None) -> List[Dict]:
+    """Get logs for a specific task, newest first, optionally with full task views
+    
+    Without a limit the whole history is returned; with one, the page
+    older than the (timestamp, id) before cursor.
+    """
+    log_queue.flush()
+    conn = get_connection(_task_shard(task_id))
+    cursor = conn.cursor()
+    
+    if limit is None:
+        rows = _select_log_partitions(cursor, 'task_id = ?', (task_id,), 'timestamp DESC, id DESC')
     else:
-        cursor.execute('''
-            SELECT * FROM action_logs 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (limit,))
+        rows = _get_log_page(cursor, 'task_id', task_id, limit, before)
+    logs = [row_to_log_dict(row) for row in rows]
+    
+    if expand and logs:
+        if limit is None:
+            logs = list(reversed(expand_log_details(list(reversed(logs)))))
+        else:
+            expanded = {log['id']: log for log in _get_expanded_history(cursor, logs)}
+            logs = [expanded.get(log['id'], log) for log in logs]
     
-    rows = cursor.fetchall()
     conn.close()
+    return logs
+
+def _get_expanded_history(cursor, logs: List[Dict]) -> List[Dict]:
+    """Load and expand the history of every task referenced by a page of logs"""
+    task_ids = list({log['task_id'] for log in logs})
+    newest = max(log['timestamp'] for log in logs)
+    placeholders = ','.join('?' * len(task_ids))
+    
+    rows = _select_log_partitions(cursor, f'task_id IN ({placeholders}) AND timestamp <= ?',
+                                  tuple(task_ids) + (newest,), 'timestamp, id')
+    
+    return expand_log_details([row_to_log_dict(row) for row in rows])
+
+def _expire_logs(cursor, cutoff_iso: str, project_ids: List[str] = None, exclude_project_ids: List[str] = None) -> Dict:
+    """Remove logs older than a cutoff, dropping partitions that are entirely older
+    
+    Whole partitions are only dropped when the cutoff applies to every project.
+    """
+    dropped = []
+    deleted = 0
+    scoped = project_ids is not None or exclude_project_ids
+    
+    for table in list_log_partitions(cursor):
+        year, month = int(table[-7:-3]), int(table[-2:])
+        partition_start = f"{year:04d}-{month:02d}"
+        partition_end = f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+        
+        if partition_start > cutoff_iso[:7]:
+            continue
+        
+        if not scoped and partition_end <= cutoff_iso:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            deleted += cursor.fetchone()[0]
+            cursor.execute(f'DROP TABLE {table}')
+            dropped.append(table)
+            continue
+        
+        where = ['timestamp < ?']
+        params = [cutoff_iso]
+        if project_ids is not None:
+            where.append(f"project_id IN ({','.join('?' * len(project_ids))})")
+            params.extend(project_ids)
+        if exclude_project_ids:
+            where.append(f"project_id NOT IN ({','.join('?' * len(exclude_project_ids))})")
+            params.extend(exclude_project_ids)
+        
+        cursor.execute(f"DELETE FROM {table} WHERE {' AND '.join(where)}", params)
+        deleted += cursor.rowcount
     
-    return [row_to_log_dict(row) for row in reversed(rows)]
+    return {'dropped_partitions': dropped, 'deleted_rows': deleted}
 
-def get_task_logs(task_id: str) -> List[Dict]:
-    """Get all logs for a specific task"""
+def _retention_cutoff(days: int) -> str:
+    cutoff_date = datetime.now().timestamp() - (days * 24 * 60 * 60)
+    return datetime.fromtimestamp(cutoff_date).isoformat()
+
+def cleanup_old_logs(days: int = DEFAULT_LOG_RETENTION_DAYS):
+    """Delete logs older than specified days"""
+    log_queue.flush()
+    deleted = 0
+    for shard_id in [None] + _shard_project_ids():
+        conn = get_connection(shard_id)
+        cursor = conn.cursor()
+        
+        deleted += _expire_logs(cursor, _retention_cutoff(days))['deleted_rows']
+        conn.commit()
+        conn.close()
+    
+    return deleted
+
+# Log retention policies
+def get_log_retention_policies() -> Dict[str, int]:
+    """Get per-project log retention in days, keyed by project ID"""
+    conn = get_connection()
+    try:
+        rows = conn.execute('SELECT project_id, retention_days FROM log_retention_policies').fetchall()
+    finally:
+        conn.close()
+    
+    return {row['project_id']: row['retention_days'] for row in rows}
+
+def set_log_retention_policy(project_id: str, retention_days: int) -> Dict:
+    """Create or replace a project's log retention policy"""
     conn = get_connection()
     cursor = conn.cursor()
     
+    now = datetime.now().isoformat()
     cursor.execute('''
-        SELECT * FROM action_logs 
-        WHERE task_id = ? 
-        ORDER BY timestamp DESC
-    ''', (task_id,))
-    rows = cursor.fetchall()
-    conn.close()
+        INSERT INTO log_retention_policies (project_id, retention_days, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(project_id) DO UPDATE SET 
+            retention_days = excluded.retention_days,
+            updated_at = excluded.updated_at
+    ''', (project_id, retention_days, now))
     
-    return [row_to_log_dict(row) for row in rows]
+    conn.commit()
+    conn.close()
+    return {'project_id': project_id, 'retention_days': retention_days, 'updated_at': now}
 
-def cleanup_old_logs(days: int = 90):
-    """Delete logs older than specified days"""
+def delete_log_retention_policy(project_id: str) -> bool:
+    """Remove a project's policy so it falls back to the default retention"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cutoff_date = datetime.now().timestamp() - (days * 24 * 60 * 60)
-    cutoff_iso = datetime.fromtimestamp(cutoff_date).isoformat()
+    cursor.execute('DELETE FROM log_retention_policies WHERE project_id = ?', (project_id,))
     
-    cursor.execute('DELETE FROM action_logs WHERE timestamp < ?', (cutoff_iso,))
     conn.commit()
-    deleted = cursor.rowcount
+    affected = cursor.rowcount > 0
     conn.close()
+    return affected
+
+def apply_log_retention(default_days: int = DEFAULT_LOG_RETENTION_DAYS) -> Dict:
+    """Expire logs according to the default and per-project retention policies
     
-    return deleted
+    Months older than the longest retention window are dropped as whole
+    partitions; projects with shorter windows are trimmed with a DELETE
+    limited to the partitions their cutoff falls in.
+    """
+    log_queue.flush()
+    policies = get_log_retention_policies()
+    if SHARDED_STORAGE:
+        return _apply_shard_log_retention(policies, default_days)
+    longest = max([default_days] + list(policies.values()))
+    
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        
+        result = _expire_logs(cursor, _retention_cutoff(longest))
+        deleted = result['deleted_rows']
+        
+        for project_id, days in policies.items():
+            if days < longest:
+                deleted += _expire_logs(cursor, _retention_cutoff(days), project_ids=[project_id])['deleted_rows']
+        
+        if default_days < longest:
+            deleted += _expire_logs(cursor, _retention_cutoff(default_days),
+                                    exclude_project_ids=list(policies))['deleted_rows']
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return {'dropped_partitions': result['dropped_partitions'], 'deleted_rows': deleted}
+
+def _apply_shard_log_retention(policies: Dict[str, int], default_days: int) -> Dict:
+    """Expire each shard's logs by its project's own window
+    
+    A shard holds a single project, so every fully expired month is dropped
+    as a whole partition. Dropped partitions are reported as project:table.
+    """
+    dropped = []
+    deleted = 0
+    for project_id in _shard_project_ids():
+        conn = get_connection(project_id)
+        try:
+            result = _expire_logs(conn.cursor(), _retention_cutoff(policies.get(project_id, default_days)))
+            conn.commit()
+        finally:
+            conn.close()
+        dropped.extend(f'{project_id}:{table}' for table in result['dropped_partitions'])
+        deleted += result['deleted_rows']
+    
+    return {'dropped_partitions': dropped, 'deleted_rows': deleted}
+
+# Action log write-behind queue
+# log_action() only appends to an in-memory buffer; a background thread writes
+# the buffer in one transaction every LOG_FLUSH_INTERVAL seconds or as soon as
+# LOG_FLUSH_BATCH_SIZE entries are waiting. Reads of the log flush first, so a
+# request always sees its own entries. Inserts ignore ids that are already
+# written, so a retried batch is harmless. Entries that still fail after
+# LOG_WRITE_MAX_ATTEMPTS flushes are dropped and reported on stderr.
+LOG_QUEUE_MAX_SIZE = 10000
+LOG_FLUSH_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 0.5
+LOG_WRITE_MAX_ATTEMPTS = 3
+
+class LogWriteQueue:
+    """Bounded buffer of action log entries written in batched transactions"""
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {'enqueued': 0, 'flushed': 0, 'batches': 0, 'overflow_flushes': 0, 'errors': 0, 'dropped': 0}
+        self._buffer = deque()
+        self._attempts = {}
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def pending(self) -> int:
+        """Number of entries waiting to be written"""
+        return len(self._buffer)
+    
+    def start(self):
+        """Start the background writer thread"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='action-log-writer', daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            # Last chance to write the buffer if the app exits without a shutdown event
+            atexit.register(self.stop)
+            self._atexit_registered = True
+    
+    def stop(self):
+        """Stop the writer thread and write everything still buffered"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def put(self, log_data: Dict):
+        """Queue a log entry, writing synchronously when the writer isn't running"""
+        with self._buffer_lock:
+            full = len(self._buffer) >= self.max_size
+        
+        if full:
+            # Apply backpressure: the caller pays for draining the backlog
+            self.stats['overflow_flushes'] += 1
+            self.flush()
+        
+        with self._buffer_lock:
+            self._buffer.append(log_data)
+            self.stats['enqueued'] += 1
+            waiting = len(self._buffer)
+        
+        if not self.running:
+            self.flush()
+        elif waiting >= self.batch_size:
+            self._wakeup.set()
+    
+    def flush(self) -> int:
+        """Write all buffered entries in one transaction
+        
+        A failed write never raises: the entries go back on the buffer for
+        the next flush, or are dropped once they have failed too often.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            
+            if not batch:
+                return 0
+            
+            try:
+                create_logs(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                self._requeue(batch, e)
+                return 0
+            
+            for log_data in batch:
+                self._attempts.pop(log_data['id'], None)
+            self.stats['flushed'] += len(batch)
+            self.stats['batches'] += 1
+            return len(batch)
+    
+    def _requeue(self, batch: List[Dict], error: Exception):
+        """Put a failed batch back, minus entries out of attempts"""
+        retry = []
+        dropped = 0
+        for log_data in batch:
+            attempts = self._attempts.get(log_data['id'], 0) + 1
+            if attempts >= LOG_WRITE_MAX_ATTEMPTS:
+                self._attempts.pop(log_data['id'], None)
+                dropped += 1
+            else:
+                self._attempts[log_data['id']] = attempts
+                retry.append(log_data)
+        
+        with self._buffer_lock:
+            self._buffer.extendleft(reversed(retry))
+        self.stats['dropped'] += dropped
+        print(f"✗ Failed to write {len(batch)} action logs ({dropped} dropped): {error}", file=sys.stderr)
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+log_queue = LogWriteQueue(LOG_QUEUE_MAX_SIZE, LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+
+# Group commit
+# High-frequency edits (task drags, note typing, planner blocks) hand their
+# write to a committer thread, which waits GROUP_COMMIT_WINDOW seconds after the
+# first write arrives and then runs every waiting write in one transaction per
+# database. Each write gets its own savepoint, so one failing write doesn't undo
+# the others, and its caller only returns once the shared commit is durable.
+GROUP_COMMIT_WINDOW = 0.002
+GROUP_COMMIT_MAX_BATCH = 64
+
+class GroupCommitter:
+    """Coalesces writes submitted within a short window into shared transactions"""
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.stats = {'writes': 0, 'commits': 0, 'largest_batch': 0, 'errors': 0}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._full = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Start the committer thread"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='group-committer', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the committer thread after committing everything still waiting"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._commit_pending()
+    
+    def run(self, shard_id: Optional[str], write, after_commit=None):
+        """Run write(cursor) in a group transaction and return its result once committed
+        
+        shard_id picks the database as for get_connection(). after_commit(cursor,
+        result) runs after the commit, e.g. to refresh caches. Without the
+        committer thread the write is committed on its own.
+        """
+        entry = {'shard_id': shard_id, 'write': write, 'after_commit': after_commit,
+                 'done': threading.Event(), 'result': None, 'error': None}
+        
+        if not self.running:
+            self._commit_batch(shard_id, [entry])
+        else:
+            with self._lock:
+                self._pending.append(entry)
+                waiting = len(self._pending)
+            self._wakeup.set()
+            if waiting >= self.max_batch:
+                self._full.set()
+            entry['done'].wait()
+        
+        if entry['error'] is not None:
+            raise entry['error']
+        return entry['result']
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Give writers arriving just after the first one a chance to join
+            self._full.wait(self.window)
+            self._full.clear()
+            self._commit_pending()
+    
+    def _commit_pending(self):
+        with self._lock:
+            batch = self._pending
+            self._pending = []
+        
+        by_shard = {}
+        for entry in batch:
+            by_shard.setdefault(entry['shard_id'], []).append(entry)
+        for shard_id, entries in by_shard.items():
+            self._commit_batch(shard_id, entries)
+    
+    def _commit_batch(self, shard_id: Optional[str], entries: List[Dict]):
+        conn = None
+        try:
+            conn = get_connection(shard_id)
+            cursor = conn.cursor()
+            # Take the write lock up front; upgrading a read lock mid-batch can deadlock
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            for entry in entries:
+                cursor.execute('SAVEPOINT group_write')
+                try:
+                    entry['result'] = entry['write'](cursor)
+                    cursor.execute('RELEASE group_write')
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO group_write')
+                    cursor.execute('RELEASE group_write')
+                    entry['error'] = e
+            
+            conn.commit()
+            self.stats['writes'] += len(entries)
+            self.stats['commits'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(entries))
+            
+            for entry in entries:
+                if entry['error'] is None and entry['after_commit'] is not None:
+                    entry['after_commit'](cursor, entry['result'])
+        except Exception as e:
+            self.stats['errors'] += 1
+            for entry in entries:
+                if entry['error'] is None:
+                    entry['error'] = e
+        finally:
+            if conn is not None:
+                conn.close()
+            for entry in entries:
+                entry['done'].set()
+
+group_commit = GroupCommitter(GROUP_COMMIT_WINDOW, GROUP_COMMIT_MAX_BATCH)
+
+# Compact action log details
+# UPDATE entries store only a field-level diff ({"diff": {field: [old, new]}}).
+# DELETE entries store the deleted task ({"snapshot": task}), since log
+# retention may expire the history it could otherwise be rebuilt from.
+# Encoded details above the threshold are zlib-compressed and stored as a BLOB
+# in the same column.
+COMPRESS_LOG_DETAILS = True
+LOG_COMPRESSION_THRESHOLD = 512
+LOG_DIFF_IGNORED_FIELDS = ('updated_at', 'subtasks', 'rollup_start', 'rollup_end', 'rollup_progress')
+
+def diff_task(old: Dict, new: Dict) -> Dict:
+    """Get the fields that changed between two versions of a task"""
+    return {
+        key: [old.get(key), value]
+        for key, value in new.items()
+        if key not in LOG_DIFF_IGNORED_FIELDS and old.get(key) != value
+    }
+
+def task_snapshot(task: Dict) -> Dict:
+    """Get the stored fields of a task, for logging a deleted task"""
+    return {key: value for key, value in task.items() if key == 'updated_at' or key not in LOG_DIFF_IGNORED_FIELDS}
+
+def encode_log_details(details: Dict):
+    """Serialize log details, compressing large payloads"""
+    encoded = json.dumps(details, separators=(',', ':'))
+    if COMPRESS_LOG_DETAILS and len(encoded) > LOG_COMPRESSION_THRESHOLD:
+        return zlib.compress(encoded.encode('utf-8'))
+    return encoded
+
+def decode_log_details(raw) -> Dict:
+    """Deserialize log details written by encode_log_details or older versions"""
+    if isinstance(raw, bytes):
+        raw = zlib.decompress(raw).decode('utf-8')
+    return json.loads(raw)
+
+def expand_log_details(logs: List[Dict]) -> List[Dict]:
+    """Rebuild full task views for compact log entries
+    
+    Logs must be ordered oldest first. UPDATE entries get the legacy
+    {"old", "new", "changes"} shape and DELETE entries get the deleted task.
+    Views are only as complete as the history that is still stored.
+    """
+    states = {}
+    
+    for log in logs:
+        details = log['details']
+        task_id = log['task_id']
+        before = states.get(task_id)
+        
+        if log['action'] in ('CREATE', 'CREATE_SUBTASK'):
+            states[task_id] = {k: v for k, v in details.items() if k != 'parent_task_name'}
+        elif log['action'] == 'UPDATE':
+            if 'diff' in details:
+                old_view = dict(before or {})
+                new_view = dict(old_view)
+                for field, (old_value, new_value) in details['diff'].items():
+                    old_view[field] = old_value
+                    new_view[field] = new_value
+                new_view['updated_at'] = log['timestamp']
+                log['details'] = {
+                    'old': old_view,
+                    'new': new_view,
+                    'changes': {field: change[1] for field, change in details['diff'].items()}
+                }
+                states[task_id] = new_view
+            elif 'new' in details:
+                states[task_id] = details['new']
+        elif log['action'] == 'DELETE':
+            if 'snapshot' in details:
+                log['details'] = details['snapshot']
+            elif not details:
+                # Written before DELETE entries kept a snapshot
+                log['details'] = dict(before or {})
+            states.pop(task_id, None)
+    
+    return logs
+
+# Health and statistics operations
+def count_tasks(project_id: str = None) -> int:
+    """Count tasks without loading them, optionally filtered by project"""
+    if SHARDED_STORAGE and not project_id:
+        return sum(count_tasks(shard_id) for shard_id in _shard_project_ids())
+    
+    conn = get_connection(project_id)
+    cursor = conn.cursor()
+    
+    if project_id:
+        cursor.execute('SELECT COUNT(*) FROM tasks WHERE project_id = ?', (project_id,))
+    else:
+        cursor.execute('SELECT COUNT(*) FROM tasks')
+    
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def count_logs(project_id: str = None) -> int:
+    """Count action logs without decoding them, optionally filtered by project"""
+    log_queue.flush()
+    if SHARDED_STORAGE and not project_id:
+        return sum(count_logs(shard_id) for shard_id in _shard_project_ids())
+    
+    conn = get_connection(project_id)
+    cursor = conn.cursor()
+    
+    count = 0
+    for table in list_log_partitions(cursor):
+        if project_id:
+            cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE project_id = ?', (project_id,))
+        else:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        count += cursor.fetchone()[0]
+    
+    conn.close()
+    return count
+
+def get_connection_stats() -> Dict:
+    """Get counters for database connections opened by this process"""
+    with _connection_stats_lock:
+        return {
+            'open': _open_connection_count(),
+            'pooled': _connection_stats['pooled'],
+            'peak_open': _connection_stats['peak_open'],
+            'total_opened': _connection_stats['opened']
+        }
+
+def get_database_stats() -> Dict:
+    """Ping the database and report latency, journal mode and file sizes"""
+    started = time.perf_counter()
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT 1')
+    cursor.fetchone()
+    latency_ms = (time.perf_counter() - started) * 1000
+    
+    cursor.execute('PRAGMA journal_mode')
+    journal_mode = cursor.fetchone()[0]
+    conn.close()
+    
+    wal_file = DATABASE_FILE + '-wal'
+    stats = {
+        'latency_ms': round(latency_ms, 3),
+        'journal_mode': journal_mode,
+        'size_bytes': os.path.getsize(DATABASE_FILE) if os.path.exists(DATABASE_FILE) else 0,
+        'wal_size_bytes': os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+        'storage': 'sharded' if SHARDED_STORAGE else 'single'
+    }
+    if SHARDED_STORAGE:
+        stats['shards'] = {**shard_pool.stats, 'idle_connections': shard_pool.idle()}
+    return stats
 
 # Helper functions
 def row_to_task_dict(row) -> Dict:
@@ -1573,7 +3219,10 @@ def row_to_task_dict(row) -> Dict:
         'assigned_to': row['assigned_to'],
         'priority': row['priority'],
         'created_at': row['created_at'],
-        'updated_at': row['updated_at']
+        'updated_at': row['updated_at'],
+        'rollup_start': row['rollup_start'],
+        'rollup_end': row['rollup_end'],
+        'rollup_progress': round(row['rollup_progress'], 2) if row['rollup_progress'] is not None else None
     }
 
 def row_to_log_dict(row) -> Dict:
@@ -1585,7 +3234,7 @@ def row_to_log_dict(row) -> Dict:
         'task_id': row['task_id'],
         'task_name': row['task_name'],
         'timestamp': row['timestamp'],
-        'details': json.loads(row['details']),
+        'details': decode_log_details(row['details']),
         'user': row['user']
     }
 
@@ -1679,6 +3328,18 @@ def get_all_planners(project_id: str = None) -> List[Dict]:
     
     return planners
 
+def row_to_planner_dict(row) -> Dict:
+    """Convert a database row to a planner dictionary"""
+    planner = dict(row)
+    planner['custom_rows'] = json.loads(planner.get('custom_rows') or '[]')
+    planner['custom_columns'] = json.loads(planner.get('custom_columns') or '[]')
+    return planner
+
+def iter_planners(project_id: str) -> Iterator[Dict]:
+    """Stream a project's weekly planners, latest week first"""
+    return iter_rows('SELECT * FROM weekly_planners WHERE project_id = ? ORDER BY week_start_date DESC',
+                     (project_id,), convert=row_to_planner_dict)
+
 def update_planner(planner_id: str, updates: Dict) -> Optional[Dict]:
     """Update a weekly planner"""
     conn = get_connection()
@@ -1772,10 +3433,7 @@ def get_time_block_by_id(block_id: str) -> Optional[Dict]:
     return None
 
 def update_time_block(block_id: str, updates: Dict) -> Optional[Dict]:
-    """Update a time block"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+    """Update a time block, group-committed and durable once this returns"""
     set_clause = []
     values = []
     
@@ -1787,13 +3445,9 @@ def update_time_block(block_id: str, updates: Dict) -> Optional[Dict]:
     set_clause.append("updated_at = ?")
     values.append(datetime.now().isoformat())
     values.append(block_id)
-    
     query = f"UPDATE time_blocks SET {', '.join(set_clause)} WHERE id = ?"
-    cursor.execute(query, values)
-    
-    conn.commit()
-    conn.close()
     
+    group_commit.run(None, lambda cursor: cursor.execute(query, values))
     return get_time_block_by_id(block_id)
 
 def delete_time_block(block_id: str) -> bool:
@@ -1932,6 +3586,14 @@ def get_markdown_file(file_id: str) -> Optional[Dict]:
         return dict(row)
     return None
 
+def iter_markdown_files_for_export(project_id: str) -> Iterator[Dict]:
+    """Stream a project's markdown files with their content, for export"""
+    return iter_rows('''
+        SELECT filename, content, updated_at FROM markdown_files
+        WHERE project_id = ?
+        ORDER BY filename, created_at
+    ''', (project_id,))
+
 def get_all_markdown_files(project_id: str = None) -> List[Dict]:
     """Get all markdown files"""
     conn = get_connection()
@@ -2056,5 +3718,90 @@ def delete_pdf_file(file_id: str) -> bool:
     conn.close()
     return affected
 
+# Search operations
+# The FTS5 tables and their sync triggers are created by migrate.py (v7).
+SEARCH_SNIPPET_TOKENS = 12
+_SNIPPET_START = '\x02'
+_SNIPPET_END = '\x03'
+
+def build_search_query(text: str) -> str:
+    """Turn free text into an FTS5 query that matches every word, the last as a prefix"""
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search(query: str, project_id: str = None, kinds: List[str] = None, limit: int = 20) -> List[Dict]:
+    """Full-text search over tasks, notes and markdown files, best matches first
+    
+    Snippets are HTML-escaped with matches wrapped in <mark> tags.
+    """
+    match = build_search_query(query)
+    if not match:
+        return []
+    note_buffer.flush()
+    
+    marks = f"'{_SNIPPET_START}', '{_SNIPPET_END}', '…', {SEARCH_SNIPPET_TOKENS}"
+    sources = {
+        'task': f'''
+            SELECT 'task' AS kind, t.id, t.project_id, t.name AS title,
+                   snippet(tasks_fts, -1, {marks}) AS snippet, bm25(tasks_fts, 10.0, 1.0) AS rank
+            FROM tasks_fts JOIN tasks t ON t.rowid = tasks_fts.rowid
+            WHERE tasks_fts MATCH ? {{scope}}
+        ''',
+        'note': f'''
+            SELECT 'note' AS kind, t.id, t.project_id, t.note_date AS title,
+                   snippet(notes_fts, 0, {marks}) AS snippet, bm25(notes_fts) AS rank
+            FROM notes_fts JOIN project_notes t ON t.rowid = notes_fts.rowid
+            WHERE notes_fts MATCH ? {{scope}}
+        ''',
+        'markdown': f'''
+            SELECT 'markdown' AS kind, t.id, t.project_id, t.filename AS title,
+                   snippet(markdown_fts, -1, {marks}) AS snippet, bm25(markdown_fts, 5.0, 1.0) AS rank
+            FROM markdown_fts JOIN markdown_files t ON t.rowid = markdown_fts.rowid
+            WHERE markdown_fts MATCH ? {{scope}}
+        '''
+    }
+    
+    selected = [kind for kind in sources if not kinds or kind in kinds]
+    if not selected:
+        return []
+    
+    scope = 'AND t.project_id = ?' if project_id else ''
+    
+    # Under sharded storage tasks are searched in each shard and merged by rank
+    batches = [(None, selected)]
+    if SHARDED_STORAGE and 'task' in selected:
+        shard_ids = [project_id] if project_id else _shard_project_ids()
+        batches = [(None, [kind for kind in selected if kind != 'task'])]
+        batches += [(shard_id, ['task']) for shard_id in shard_ids]
+    
+    rows = []
+    for shard_id, batch_kinds in batches:
+        if not batch_kinds:
+            continue
+        params = []
+        for _ in batch_kinds:
+            params.append(match)
+            if project_id:
+                params.append(project_id)
+        
+        conn = get_connection(shard_id)
+        cursor = conn.cursor()
+        
+        query_sql = ' UNION ALL '.join(sources[kind].format(scope=scope) for kind in batch_kinds)
+        cursor.execute(f'{query_sql} ORDER BY rank LIMIT ?', params + [limit])
+        rows.extend(cursor.fetchall())
+        conn.close()
+    
+    results = []
+    for row in sorted(rows, key=lambda row: row['rank'])[:limit]:
+        result = dict(row)
+        result['snippet'] = (html.escape(result['snippet'] or '')
+                             .replace(_SNIPPET_START, '<mark>')
+                             .replace(_SNIPPET_END, '</mark>'))
+        results.append(result)
+    return results
+
 if __name__ == "__main__":
     init_database()
\ No newline at end of file
@@ -971,18 +971,42 @@
 #     print("Access the application at: http://localhost:8000")
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
 
-from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile, File
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from collections import OrderedDict
+from contextvars import ContextVar
+from urllib.parse import quote
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
 import uuid
 import io
+import zipfile
 import openpyxl
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 
+try:
+    from markdown_it import MarkdownIt
+except ImportError:  # Optional: without it the browser renders markdown itself
+    MarkdownIt = None
+
+try:
+    import orjson
+except ImportError:  # Optional: without it fast responses are encoded with json
+    orjson = None
+
 import database as db
 
 app = FastAPI(title="Gantt Chart API", description="Multi-project Gantt chart application with notes")
@@ -1028,6 +1052,15 @@ class NoteCreate(BaseModel):
 class NoteUpdate(BaseModel):
     content: str
 
+class NoteTextPatch(BaseModel):
+    start: int
+    end: int
+    text: str = ""
+
+class NotePatch(BaseModel):
+    base_revision: int
+    patches: List[NoteTextPatch]
+
 class Task(BaseModel):
     id: str
     project_id: str
@@ -1112,22 +1145,148 @@ class TimeBlockUpdate(BaseModel):
     description: Optional[str] = None
     color: Optional[str] = None
 
+class LogRetentionUpdate(BaseModel):
+    retention_days: int
+
+# Event loop lag, sampled in the background and reported by the health endpoints
+LOOP_LAG_INTERVAL = 0.5
+loop_lag = {'current_ms': 0.0, 'max_ms': 0.0}
+
+async def monitor_event_loop_lag():
+    """Measure how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag_ms = max(0.0, (loop.time() - started - LOOP_LAG_INTERVAL) * 1000)
+        loop_lag['current_ms'] = round(lag_ms, 3)
+        loop_lag['max_ms'] = max(loop_lag['max_ms'], loop_lag['current_ms'])
+
+# Action log retention, applied in the background
+LOG_RETENTION_INTERVAL = 6 * 60 * 60
+
+async def run_log_retention():
+    """Periodically expire action logs according to the retention policies"""
+    while True:
+        try:
+            result = await asyncio.to_thread(db.apply_log_retention)
+            if result['deleted_rows']:
+                print(f"✓ Log retention removed {result['deleted_rows']} entries "
+                      f"({len(result['dropped_partitions'])} partitions dropped)")
+        except sqlite3.Error as e:
+            print(f"✗ Log retention failed: {e}")
+        await asyncio.sleep(LOG_RETENTION_INTERVAL)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the database when the app starts"""
     db.init_database()
+    db.log_queue.start()
+    db.group_commit.start()
+    db.note_buffer.start()
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    app.state.retention_task = asyncio.create_task(run_log_retention())
     print("✓ Database ready")
 
-def get_current_project_id():
-    """Get the currently active project ID"""
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and write buffered logs when the app shuts down"""
+    for task_name in ('loop_lag_task', 'retention_task'):
+        background_task = getattr(app.state, task_name, None)
+        if background_task:
+            background_task.cancel()
+    db.note_buffer.stop()
+    db.group_commit.stop()
+    db.log_queue.stop()
+
+# Active project
+# A request's project is, in order: a project_id query parameter or the
+# X-Project-Id header (an explicit choice, which must exist on routes scoped
+# to a project), the client's selection kept in a signed cookie, or the
+# globally active project. Clients switching projects therefore no longer
+# overwrite each other's context. The
+# global default and the set of project ids are cached, and dropped whenever
+# the database's projects_version shows another worker changed a project.
+# Cookies are signed with GANTT_SESSION_SECRET, or else a secret generated
+# once and stored in the database, so they survive restarts and work across
+# workers.
+PROJECT_HEADER = "X-Project-Id"
+PROJECT_COOKIE = "gantt_project"
+PROJECT_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+PROJECT_COOKIE_SECRET = os.environ.get("GANTT_SESSION_SECRET")
+
+client_project_id: ContextVar[Optional[str]] = ContextVar("client_project_id", default=None)
+requested_project_id: ContextVar[Optional[str]] = ContextVar("requested_project_id", default=None)
+project_state = {'default_id': None, 'known_ids': None, 'version': None, 'cookie_secret': None}
+
+def get_project_cookie_secret() -> bytes:
+    if project_state['cookie_secret'] is None:
+        project_state['cookie_secret'] = (PROJECT_COOKIE_SECRET or db.get_session_secret()).encode()
+    return project_state['cookie_secret']
+
+def sign_project_id(project_id: str) -> str:
+    """Build a project cookie value that can't be altered by the client"""
+    signature = hmac.new(get_project_cookie_secret(), project_id.encode(), hashlib.sha256).digest()
+    return f"{project_id}.{base64.urlsafe_b64encode(signature).decode().rstrip('=')}"
+
+def verify_project_cookie(value: Optional[str]) -> Optional[str]:
+    """Get the project id from a signed cookie, or None if it was tampered with"""
+    if not value or '.' not in value:
+        return None
+    project_id = value.rsplit('.', 1)[0]
+    return project_id if hmac.compare_digest(sign_project_id(project_id), value) else None
+
+def remember_client_project(response: Response, project_id: str):
+    """Select a project for the requesting client"""
+    client_project_id.set(project_id)
+    response.set_cookie(PROJECT_COOKIE, sign_project_id(project_id),
+                        max_age=PROJECT_COOKIE_MAX_AGE, httponly=True, samesite="lax")
+
+def get_known_project_ids() -> set:
+    version = db.get_projects_version()
+    if version != project_state['version']:
+        forget_project_cache()
+        project_state['version'] = version
+    if project_state['known_ids'] is None:
+        project_state['known_ids'] = {project['id'] for project in db.get_all_projects()}
+    return project_state['known_ids']
+
+def forget_project_cache():
+    """Drop cached project lookups after projects are created, deleted or activated"""
+    project_state['default_id'] = None
+    project_state['known_ids'] = None
+
+def get_current_project_id(project_id: Optional[str] = None, strict: bool = True):
+    """Get the project a request works on
+    
+    An explicit project_id argument wins over the request's own selection.
+    Routes that aren't scoped to a project pass strict=False, so a header or
+    query parameter naming a deleted project falls back to the client's
+    selection instead of failing with a 404.
+    """
+    known_ids = get_known_project_ids()
+    requested = project_id or requested_project_id.get()
+    if requested in known_ids:
+        return requested
+    if requested and (strict or project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    selected = client_project_id.get()
+    if selected in known_ids:
+        return selected
+    if project_state['default_id'] in known_ids:
+        return project_state['default_id']
+    
     project = db.get_active_project()
     if project:
+        project_state['default_id'] = project['id']
         return project['id']
     
     # If no active project, get the first one or create default
     projects = db.get_all_projects()
     if projects:
         db.set_active_project(projects[0]['id'])
+        project_state['default_id'] = projects[0]['id']
         return projects[0]['id']
     
     # Create default project
@@ -1141,6 +1300,8 @@ def get_current_project_id():
     }
     db.create_project(default_project)
     db.set_active_project(default_project['id'])
+    forget_project_cache()
+    project_state['default_id'] = default_project['id']
     return default_project['id']
 
 def validate_dependencies(task_id: str, dependencies: List[str], project_id: str) -> List[str]:
@@ -1231,7 +1392,7 @@ def calculate_critical_path(project_id: str) -> List[str]:
     return critical_path
 
 def log_action(action: str, task_id: str, task_name: str, details: Dict, project_id: str, user: str = "system"):
-    """Add an action to the log"""
+    """Add an action to the log (written in the background by the log queue)"""
     log_data = {
         'id': str(uuid.uuid4()),
         'project_id': project_id,
@@ -1242,7 +1403,30 @@ def log_action(action: str, task_id: str, task_name: str, details: Dict, project
         'details': details,
         'user': user
     }
-    db.create_log(log_data)
+    db.log_queue.put(log_data)
+
+# Largest page of logs a single request may ask for
+MAX_LOG_PAGE_SIZE = 500
+
+def encode_log_cursor(log: Dict) -> str:
+    """Encode a log entry's (timestamp, id) as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(f"{log['timestamp']}|{log['id']}".encode('utf-8')).decode('ascii')
+
+def decode_log_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Decode a pagination cursor back into (timestamp, id)"""
+    if not cursor:
+        return None
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return (timestamp, log_id)
+
+@app.middleware("http")
+async def track_client_project(request: Request, call_next):
+    client_project_id.set(verify_project_cookie(request.cookies.get(PROJECT_COOKIE)))
+    requested_project_id.set(request.query_params.get("project_id") or request.headers.get(PROJECT_HEADER))
+    return await call_next(request)
 
 @app.middleware("http")
 async def add_cors_header(request: Request, call_next):
@@ -1255,20 +1439,24 @@ async def add_cors_header(request: Request, call_next):
 # Project endpoints
 @app.get("/api/projects")
 async def get_projects():
-    """Get all projects"""
+    """Get all projects, flagging the one active for this client"""
+    current_id = get_current_project_id(strict=False)
     projects = db.get_all_projects()
+    for project in projects:
+        project['is_active'] = project['id'] == current_id
     return {"projects": projects}
 
 @app.get("/api/projects/active")
 async def get_active_project():
-    """Get the currently active project"""
-    project = db.get_active_project()
+    """Get the project active for this client"""
+    project = db.get_project_by_id(get_current_project_id(strict=False))
     if not project:
         raise HTTPException(status_code=404, detail="No active project")
+    project['is_active'] = True
     return {"project": project}
 
 @app.post("/api/projects")
-async def create_project(project_data: ProjectCreate):
+async def create_project(project_data: ProjectCreate, response: Response):
     """Create a new project"""
     project_id = str(uuid.uuid4())
     now = datetime.now().isoformat()
@@ -1285,7 +1473,8 @@ async def create_project(project_data: ProjectCreate):
     }
     
     db.create_project(project_dict)
-    db.set_active_project(project_id)
+    forget_project_cache()
+    remember_client_project(response, project_id)
     
     return {"project": project_dict, "message": "Project created successfully"}
 
@@ -1302,7 +1491,7 @@ async def update_project(project_id: str, updates: ProjectUpdate):
     return {"project": updated_project, "message": "Project updated successfully"}
 
 @app.delete("/api/projects/{project_id}")
-async def delete_project(project_id: str):
+async def delete_project(project_id: str, response: Response):
     """Delete a project and all its data"""
     project = db.get_project_by_id(project_id)
     if not project:
@@ -1313,26 +1502,85 @@ async def delete_project(project_id: str):
     if len(all_projects) == 1:
         raise HTTPException(status_code=400, detail="Cannot delete the only project")
     
+    current_id = get_current_project_id(strict=False)
     db.delete_project(project_id)
+    forget_project_cache()
     
-    # Set another project as active if this was the active one
-    if project.get('is_active'):
-        remaining_projects = db.get_all_projects()
-        if remaining_projects:
-            db.set_active_project(remaining_projects[0]['id'])
+    # Move this client to another project if it was working on this one. Other
+    # clients, and the global default, fall back on their next request.
+    if current_id == project_id:
+        remaining_id = next(other['id'] for other in all_projects if other['id'] != project_id)
+        remember_client_project(response, remaining_id)
     
     return {"message": "Project deleted successfully"}
 
 @app.post("/api/projects/{project_id}/activate")
-async def activate_project(project_id: str):
-    """Set a project as the active project"""
-    project = db.get_project_by_id(project_id)
-    if not project:
+async def activate_project(project_id: str, response: Response):
+    """Set a project as the active project for this client"""
+    if project_id not in get_known_project_ids():
         raise HTTPException(status_code=404, detail="Project not found")
     
-    db.set_active_project(project_id)
+    remember_client_project(response, project_id)
     return {"message": "Project activated successfully"}
 
+# Fast JSON responses
+# The task, log and sheet-read endpoints return FastJSONResponse themselves.
+# That skips FastAPI's jsonable_encoder pass over the whole payload, and the
+# payload is encoded with orjson when it is installed. Only plain dicts,
+# lists and scalars should be returned this way.
+def json_default(value):
+    """Encode the non-JSON types responses may hold, the way jsonable_encoder does
+    
+    Anything else raises TypeError rather than reaching the client as its str().
+    """
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_json(content) -> bytes:
+    """Encode a payload as compact UTF-8 JSON, with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":"), default=json_default).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by encode_json"""
+    def render(self, content) -> bytes:
+        return encode_json(content)
+
+# Streamed list responses
+# The /stream variants of the list endpoints send NDJSON, one object per line,
+# read from the database in batches as the client consumes them. Memory use
+# and time to first byte stay flat however long the list grows.
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def ndjson_response(rows) -> StreamingResponse:
+    """Stream dicts as newline-delimited JSON, a batch of lines per chunk"""
+    def lines():
+        try:
+            batch = []
+            for row in rows:
+                batch.append(encode_json(row))
+                if len(batch) >= db.STREAM_BATCH_SIZE:
+                    yield b'\n'.join(batch) + b'\n'
+                    batch = []
+            if batch:
+                yield b'\n'.join(batch) + b'\n'
+        finally:
+            if hasattr(rows, 'close'):
+                rows.close()
+    
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
 # Project notes endpoints
 @app.get("/api/projects/{project_id}/notes")
 async def get_project_notes(project_id: str):
@@ -1344,6 +1592,126 @@ async def get_project_notes(project_id: str):
     notes = db.get_all_notes_for_project(project_id)
     return {"notes": notes}
 
+@app.get("/api/projects/{project_id}/notes/stream")
+async def stream_project_notes(project_id: str):
+    """Stream all notes for a project as NDJSON, newest first"""
+    project = db.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    return ndjson_response(await asyncio.to_thread(db.iter_notes_for_project, project_id))
+
+@app.get("/api/projects/{project_id}/notes/calendar")
+async def get_notes_calendar(project_id: str, start: str, end: str):
+    """Get the dates in a range that have notes, for marking the calendar
+    
+    Note bodies are not included; fetch a date's note when it is opened.
+    """
+    project = db.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    try:
+        start_date = datetime.fromisoformat(start).date().isoformat()
+        end_date = datetime.fromisoformat(end).date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates")
+    
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    return {"start": start_date, "end": end_date, "dates": db.get_note_dates(project_id, start_date, end_date)}
+
+# Download headers
+# Filenames come from project names and uploads, so they may hold spaces,
+# semicolons, quotes or non-ASCII characters. The header carries a quoted
+# ASCII filename for old clients and the exact name as RFC 5987 filename*.
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    """Build a Content-Disposition header value that is safe for any filename"""
+    fallback = ''.join(c if 32 <= ord(c) < 127 else '_' for c in filename)
+    fallback = fallback.replace('\\', '\\\\').replace('"', '\\"')
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+# Notes export
+# The archive is written entry by entry into a sink that is emptied after each
+# note, so only one note is held in memory however many the project has.
+class ZipStream(io.RawIOBase):
+    """Unseekable sink whose contents are taken as the zip is written"""
+    def __init__(self):
+        self._buffer = bytearray()
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+    
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def archive_name(name: str) -> str:
+    """Make a note date or uploaded filename safe to use as a zip entry"""
+    name = name.replace('\\', '/').split('/')[-1].strip().lstrip('.')
+    return ''.join(c if c.isalnum() or c in ' ._-()' else '_' for c in name) or 'untitled'
+
+def archive_entry(name: str, timestamp: str) -> zipfile.ZipInfo:
+    """Zip entry stamped with the document's last update time"""
+    try:
+        modified = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        modified = datetime.now()
+    entry = zipfile.ZipInfo(name, date_time=max(modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0)))
+    entry.compress_type = zipfile.ZIP_DEFLATED
+    return entry
+
+def stream_notes_archive(notes, files):
+    """Yield a zip of notes/<date>.md and files/<filename> as it is built"""
+    sink = ZipStream()
+    try:
+        with zipfile.ZipFile(sink, 'w') as archive:
+            for note in notes:
+                archive.writestr(archive_entry(f"notes/{archive_name(note['note_date'])}.md", note['updated_at']),
+                                 note['content'])
+                yield sink.take()
+            
+            used = set()
+            for file_data in files:
+                name = archive_name(file_data['filename'])
+                stem, dot, extension = name.rpartition('.') if '.' in name else (name, '', '')
+                copy = 1
+                while name.lower() in used:
+                    copy += 1
+                    name = f"{stem} ({copy}){dot}{extension}"
+                used.add(name.lower())
+                archive.writestr(archive_entry(f"files/{name}", file_data['updated_at']), file_data['content'])
+                yield sink.take()
+        yield sink.take()
+    finally:
+        notes.close()
+        files.close()
+
+@app.get("/api/projects/{project_id}/notes/export")
+async def export_notes(project_id: str):
+    """Download a project's notes and markdown files as a zip of .md files"""
+    project = db.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    notes = await asyncio.to_thread(db.iter_notes_for_export, project_id)
+    files = db.iter_markdown_files_for_export(project_id)
+    filename = f"{archive_name(project['name']).replace(' ', '_')}_notes.zip"
+    
+    return StreamingResponse(
+        stream_notes_archive(notes, files),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": content_disposition(filename)
+        }
+    )
+
 @app.get("/api/projects/{project_id}/notes/{note_date}")
 async def get_note_by_date(project_id: str, note_date: str):
     """Get a note for a specific date"""
@@ -1360,43 +1728,55 @@ async def get_note_by_date(project_id: str, note_date: str):
 @app.post("/api/projects/{project_id}/notes")
 async def create_note(project_id: str, note_data: NoteCreate):
     """Create or update a note for a specific date"""
-    project = db.get_project_by_id(project_id)
-    if not project:
+    if project_id not in get_known_project_ids():
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Check if note already exists for this date
-    existing_note = db.get_note_by_date(project_id, note_data.note_date)
+    # A single upsert on (project_id, note_date); the id is only used if the note is new
+    note = await asyncio.to_thread(db.save_note, str(uuid.uuid4()), project_id,
+                                   note_data.note_date, note_data.content)
     
-    if existing_note:
-        # Update existing note
-        updated_note = db.update_note(existing_note['id'], {'content': note_data.content})
-        return {"note": updated_note, "message": "Note updated successfully"}
-    else:
-        # Create new note
-        note_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
-        
-        note_dict = {
-            'id': note_id,
-            'project_id': project_id,
-            'note_date': note_data.note_date,
-            'content': note_data.content,
-            'created_at': now,
-            'updated_at': now
-        }
-        
-        db.create_note(note_dict)
-        return {"note": note_dict, "message": "Note created successfully"}
+    if note['revision'] == 0:
+        return {"note": note, "message": "Note created successfully"}
+    return {"note": note, "message": "Note updated successfully"}
 
 @app.put("/api/notes/{note_id}")
 async def update_note(note_id: str, updates: NoteUpdate):
     """Update an existing note"""
-    updated_note = db.update_note(note_id, {'content': updates.content})
+    updated_note = await asyncio.to_thread(db.update_note, note_id, {'content': updates.content})
     if not updated_note:
         raise HTTPException(status_code=404, detail="Note not found")
     
     return {"note": updated_note, "message": "Note updated successfully"}
 
+@app.patch("/api/notes/{note_id}")
+async def patch_note(note_id: str, note_patch: NotePatch):
+    """Apply text patches made against a note revision
+    
+    Only the new revision is returned. A stale base_revision gets a 409
+    with the current note so the client can rebase its edits.
+    """
+    try:
+        note = await asyncio.to_thread(db.note_buffer.patch, note_id, note_patch.base_revision,
+                                       [patch.model_dump() for patch in note_patch.patches])
+    except db.NoteConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Note was changed elsewhere", "note": e.note})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    
+    return {"id": note_id, "revision": note['revision'], "updated_at": note['updated_at']}
+
+@app.get("/api/notes/{note_id}/html")
+async def get_note_html(note_id: str):
+    """Get a note rendered to sanitized HTML"""
+    note = db.get_note_by_id(note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    
+    return await render_markdown_response(note['content'])
+
 @app.delete("/api/notes/{note_id}")
 async def delete_note(note_id: str):
     """Delete a note"""
@@ -1413,16 +1793,25 @@ async def read_root():
     return FileResponse("static/index.html")
 
 @app.get("/api/tasks")
-async def get_tasks():
-    """Get all tasks for the active project"""
+async def get_tasks(hierarchy: bool = True):
+    """Get all tasks for the active project
+    
+    Pass hierarchy=false to skip building hierarchical_tasks; clients that
+    only need part of the tree should use /api/tasks/tree instead.
+    """
     project_id = get_current_project_id()
     tasks_list = db.get_all_tasks(project_id)
     critical_path = calculate_critical_path(project_id)
     
+    return FastJSONResponse(build_tasks_payload(tasks_list, critical_path, project_id, hierarchy))
+
+def build_tasks_payload(tasks_list: List[Dict], critical_path: List[str], project_id: str,
+                        hierarchy: bool = True) -> Dict:
+    """Build the /api/tasks payload: the flat list, the subtask tree and summary counts"""
     root_tasks = []
     task_children = {}
     
-    for task in tasks_list:
+    for task in tasks_list if hierarchy else []:
         parent_id = task.get('parent_id')
         if parent_id:
             if parent_id not in task_children:
@@ -1452,19 +1841,129 @@ async def get_tasks():
         "project_id": project_id
     }
 
+# Largest page of tasks /api/tasks/query may return
+MAX_TASK_QUERY_LIMIT = 5000
+
+def parse_date_window(start: Optional[str], end: Optional[str]) -> tuple:
+    """Normalize a timeline window's ISO dates, with a 422 for bad input"""
+    try:
+        window_start = datetime.fromisoformat(start).date().isoformat() if start else None
+        window_end = datetime.fromisoformat(end).date().isoformat() if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="start and end must be ISO dates")
+    
+    if window_start and window_end and window_end < window_start:
+        raise HTTPException(status_code=422, detail="end must not be before start")
+    return window_start, window_end
+
+@app.get("/api/tasks/query")
+async def query_tasks(project_id: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                      assigned_to: Optional[str] = None, priority: Optional[str] = None,
+                      min_progress: Optional[float] = None, max_progress: Optional[float] = None,
+                      is_milestone: Optional[bool] = None, parent_id: Optional[str] = None,
+                      sort: str = "start_date", order: str = "asc",
+                      limit: int = Query(500, ge=1, le=MAX_TASK_QUERY_LIMIT), offset: int = Query(0, ge=0)):
+    """Query tasks with server-side filters
+    
+    start/end select tasks overlapping that date window, priority is a
+    comma-separated list, and parent_id limits results to that task's subtree.
+    """
+    project_id = get_current_project_id(project_id)
+    priorities = [p.strip() for p in priority.split(',')] if priority else None
+    start, end = parse_date_window(start, end)
+    
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    
+    try:
+        tasks_list = db.query_tasks(
+            project_id,
+            window_start=start,
+            window_end=end,
+            assigned_to=assigned_to,
+            priorities=priorities,
+            min_progress=min_progress,
+            max_progress=max_progress,
+            is_milestone=is_milestone,
+            subtree_of=parent_id,
+            sort_by=sort,
+            descending=order == "desc",
+            limit=limit,
+            offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return FastJSONResponse({"tasks": tasks_list, "count": len(tasks_list), "project_id": project_id})
+
+@app.get("/api/tasks/window")
+async def get_tasks_in_window(start: str, end: str, project_id: Optional[str] = None):
+    """Get only the tasks visible in a timeline date range"""
+    project_id = get_current_project_id(project_id)
+    window_start, window_end = parse_date_window(start, end)
+    
+    tasks_list = db.get_tasks_in_window(project_id, window_start, window_end)
+    return FastJSONResponse({
+        "tasks": tasks_list,
+        "count": len(tasks_list),
+        "start": window_start,
+        "end": window_end,
+        "project_id": project_id
+    })
+
+@app.get("/api/tasks/stream")
+async def stream_tasks():
+    """Stream the active project's tasks as NDJSON in creation order
+    
+    Tasks are sent flat, without subtasks or the critical path; use
+    parent_id to build the tree on the client.
+    """
+    return ndjson_response(db.iter_tasks(get_current_project_id()))
+
+@app.get("/api/tasks/tree")
+async def get_task_tree(project_id: Optional[str] = None):
+    """Get the root tasks with child counts and rolled-up progress and dates"""
+    project_id = get_current_project_id(project_id)
+    roots = db.get_task_tree_level(project_id)
+    
+    return FastJSONResponse({"tasks": roots, "count": len(roots), "project_id": project_id})
+
 @app.get("/api/tasks/{task_id}")
-async def get_task(task_id: str):
-    """Get a specific task"""
+async def get_task(task_id: str, expand: bool = False, log_limit: int = Query(10, ge=1, le=MAX_LOG_PAGE_SIZE)):
+    """Get a specific task with its most recent logs"""
     task = db.get_task_by_id(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_logs = db.get_task_logs(task_id)
+    task_logs = db.get_task_logs(task_id, expand, limit=log_limit)
     
-    return {
+    return FastJSONResponse({
         "task": task,
-        "logs": task_logs[-10:]
-    }
+        "logs": task_logs,
+        "next_log_cursor": encode_log_cursor(task_logs[-1]) if task_logs and len(task_logs) == log_limit else None
+    })
+
+@app.get("/api/tasks/{task_id}/logs")
+async def get_task_logs(task_id: str, limit: int = Query(50, ge=1, le=MAX_LOG_PAGE_SIZE),
+                        cursor: Optional[str] = None, expand: bool = False):
+    """Page through a task's logs, newest first"""
+    task_logs = db.get_task_logs(task_id, expand, limit=limit, before=decode_log_cursor(cursor))
+    
+    return FastJSONResponse({
+        "logs": task_logs,
+        "next_cursor": encode_log_cursor(task_logs[-1]) if task_logs and len(task_logs) == limit else None
+    })
+
+@app.get("/api/tasks/{task_id}/children")
+async def get_task_children(task_id: str):
+    """Get a task's direct subtasks, loaded when the task is expanded"""
+    task = db.get_task_by_id(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    children = db.get_task_tree_level(task['project_id'], task_id)
+    
+    return FastJSONResponse({"parent_id": task_id, "tasks": children, "count": len(children)})
 
 @app.post("/api/tasks")
 async def create_task(task_data: TaskCreate):
@@ -1506,18 +2005,25 @@ async def update_task(task_id: str, updates: TaskUpdate):
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    old_data = task.copy()
     update_data = updates.model_dump(exclude_unset=True)
     
     if 'dependencies' in update_data:
         update_data['dependencies'] = validate_dependencies(task_id, update_data['dependencies'], task['project_id'])
     
-    updated_task = db.update_task(task_id, update_data)
+    new_parent_id = update_data.get('parent_id')
+    if new_parent_id and new_parent_id != task['parent_id']:
+        parent_task = db.get_task_by_id(new_parent_id)
+        if not parent_task or parent_task['project_id'] != task['project_id']:
+            raise HTTPException(status_code=400, detail="Parent task not found in this project")
+        if parent_task['is_milestone']:
+            raise HTTPException(status_code=400, detail="Cannot create subtasks under milestones")
+        if db.is_in_subtree(new_parent_id, task_id):
+            raise HTTPException(status_code=400, detail="Cannot move a task under itself or its subtasks")
+    
+    updated_task = await asyncio.to_thread(db.update_task, task_id, update_data)
     
     log_action("UPDATE", task_id, updated_task['name'], {
-        "old": old_data,
-        "new": updated_task,
-        "changes": update_data
+        "diff": db.diff_task(task, updated_task)
     }, task['project_id'])
     
     return {"task": updated_task, "message": "Task updated successfully"}
@@ -1532,7 +2038,8 @@ async def delete_task(task_id: str):
     task_name = task['name']
     project_id = task['project_id']
     
-    log_action("DELETE", task_id, task_name, task, project_id)
+    # Keep the deleted task itself: retention may already have expired its CREATE entry
+    log_action("DELETE", task_id, task_name, {"snapshot": db.task_snapshot(task)}, project_id)
     db.delete_task(task_id)
     
     return {"message": "Task deleted successfully"}
@@ -1581,11 +2088,86 @@ async def create_subtask(parent_id: str, task_data: TaskCreate):
     return {"task": task_dict, "message": f"Subtask created under '{parent_task['name']}'"}
 
 @app.get("/api/logs")
-async def get_logs(limit: int = 50):
-    """Get recent action logs for active project"""
+async def get_logs(limit: int = Query(50, ge=1, le=MAX_LOG_PAGE_SIZE), cursor: Optional[str] = None,
+                   expand: bool = False):
+    """Get recent action logs for active project
+    
+    Pass next_cursor back as cursor to get the page of older logs.
+    """
     project_id = get_current_project_id()
-    logs = db.get_logs(project_id, limit)
-    return {"logs": logs}
+    logs = db.get_logs(project_id, limit, expand, before=decode_log_cursor(cursor))
+    return FastJSONResponse({
+        "logs": logs,
+        "next_cursor": encode_log_cursor(logs[0]) if logs and len(logs) == limit else None
+    })
+
+@app.get("/api/logs/stream")
+async def stream_logs():
+    """Stream the active project's whole log history as NDJSON, oldest first
+    
+    Entries are sent compact, as stored; use /api/logs?expand=true for full
+    task views.
+    """
+    return ndjson_response(db.iter_logs(get_current_project_id()))
+
+@app.post("/api/logs/retention/run")
+async def run_log_retention_now():
+    """Apply the log retention policies immediately"""
+    result = await asyncio.to_thread(db.apply_log_retention)
+    return {**result, "message": "Log retention applied"}
+
+@app.get("/api/projects/{project_id}/log-retention")
+async def get_log_retention(project_id: str):
+    """Get the log retention policy for a project"""
+    project = db.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    policies = db.get_log_retention_policies()
+    return {
+        "project_id": project_id,
+        "retention_days": policies.get(project_id, db.DEFAULT_LOG_RETENTION_DAYS),
+        "is_default": project_id not in policies
+    }
+
+@app.put("/api/projects/{project_id}/log-retention")
+async def set_log_retention(project_id: str, policy: LogRetentionUpdate):
+    """Set how many days of action logs to keep for a project"""
+    project = db.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    if policy.retention_days < 1:
+        raise HTTPException(status_code=400, detail="Retention must be at least 1 day")
+    
+    saved = db.set_log_retention_policy(project_id, policy.retention_days)
+    return {"policy": saved, "message": "Log retention updated successfully"}
+
+@app.delete("/api/projects/{project_id}/log-retention")
+async def delete_log_retention(project_id: str):
+    """Reset a project to the default log retention"""
+    deleted = db.delete_log_retention_policy(project_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="No retention policy for this project")
+    
+    return {"message": "Log retention reset to default"}
+
+@app.get("/api/search")
+async def search(q: str, project_id: Optional[str] = None, kinds: Optional[str] = None,
+                 limit: int = 20, all_projects: bool = False):
+    """Full-text search over tasks, notes and markdown files
+    
+    Results are scoped to project_id (default: the active project) unless
+    all_projects is set. kinds is a comma-separated subset of task,note,markdown.
+    """
+    if not all_projects:
+        project_id = get_current_project_id(project_id)
+    
+    kind_list = [kind.strip() for kind in kinds.split(',')] if kinds else None
+    # Runs in a thread because search writes buffered note patches first
+    results = await asyncio.to_thread(db.search, q, None if all_projects else project_id, kind_list, limit)
+    
+    return {"query": q, "results": results, "count": len(results)}
 
 @app.get("/api/analytics")
 async def get_analytics():
@@ -1627,8 +2209,8 @@ async def get_analytics():
 async def health_check():
     """Health check endpoint"""
     project_id = get_current_project_id()
-    tasks_count = len(db.get_all_tasks(project_id))
-    logs_count = len(db.get_logs(project_id, limit=10000))
+    tasks_count = db.count_tasks(project_id)
+    logs_count = db.count_logs(project_id)
     
     return {
         "status": "healthy",
@@ -1639,6 +2221,37 @@ async def health_check():
         "current_project": project_id
     }
 
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness probe - answers without touching the database"""
+    return {
+        "status": "alive",
+        "timestamp": datetime.now().isoformat(),
+        "event_loop_lag_ms": loop_lag['current_ms']
+    }
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness probe - checks the database and reports load indicators"""
+    try:
+        database_stats = db.get_database_stats()
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    
+    return {
+        "status": "ready",
+        "timestamp": datetime.now().isoformat(),
+        "database": database_stats,
+        "connections": db.get_connection_stats(),
+        "log_queue": {**db.log_queue.stats, "pending": db.log_queue.pending()},
+        "group_commit": db.group_commit.stats,
+        "note_buffer": {**db.note_buffer.stats, "pending": db.note_buffer.pending()},
+        "task_cache": {**db.task_cache.stats, "tasks": db.task_cache.size()},
+        "markdown_cache": {**markdown_cache.stats, "entries": markdown_cache.size()},
+        "event_loop_lag_ms": loop_lag['current_ms'],
+        "event_loop_lag_max_ms": loop_lag['max_ms']
+    }
+
 # Weekly planner endpoints
 @app.get("/planner")
 async def read_planner():
@@ -1657,7 +2270,7 @@ async def create_planner(planner_data: PlannerCreate):
     
     planner_dict = {
         'id': planner_id,
-        'project_id': planner_data.project_id or get_current_project_id(),
+        'project_id': get_current_project_id(planner_data.project_id),
         'week_start_date': planner_data.week_start_date,
         'week_end_date': end_date.date().isoformat(),
         'custom_rows': [],
@@ -1676,6 +2289,11 @@ async def get_planners():
     planners = db.get_all_planners(project_id)
     return {"planners": planners}
 
+@app.get("/api/planners/stream")
+async def stream_planners():
+    """Stream the active project's weekly planners as NDJSON, latest week first"""
+    return ndjson_response(db.iter_planners(get_current_project_id()))
+
 @app.get("/api/planners/week/{week_start_date}")
 async def get_planner_by_week(week_start_date: str):
     """Get planner for a specific week (ISO week aligned - Monday start)"""
@@ -1767,7 +2385,7 @@ async def get_planner_blocks(planner_id: str):
 async def update_block(block_id: str, updates: TimeBlockUpdate):
     """Update a time block"""
     update_data = updates.model_dump(exclude_unset=True)
-    updated_block = db.update_time_block(block_id, update_data)
+    updated_block = await asyncio.to_thread(db.update_time_block, block_id, update_data)
     
     if not updated_block:
         raise HTTPException(status_code=404, detail="Time block not found")
@@ -1826,7 +2444,7 @@ async def download_xlsx(file_id: str):
         content=file_data['file_data'],
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={
-            "Content-Disposition": f"attachment; filename={file_data['filename']}"
+            "Content-Disposition": content_disposition(file_data['filename'])
         }
     )
 
@@ -1839,6 +2457,64 @@ async def delete_xlsx(file_id: str):
     
     return {"message": "File deleted successfully"}
 
+# Markdown rendering
+# Notes and markdown files can be rendered on the server, with raw HTML
+# escaped and unsafe link schemes rejected so the result can be inserted as
+# is. Renderings are cached by content hash, least recently used first. The
+# key is the content itself, so however a note or file changes (patches, saves,
+# migrations) its next rendering can't be stale; old versions just age out.
+MARKDOWN_CACHE_MAX_ENTRIES = 500
+
+class MarkdownCache:
+    """LRU cache of rendered HTML keyed by the SHA-256 of the markdown"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._renderer = None
+        self._html = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def render(self, content: str) -> Dict:
+        """Get the HTML for markdown, rendering it on a miss"""
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        with self._lock:
+            html = self._html.get(content_hash)
+            if html is not None:
+                self._html.move_to_end(content_hash)
+                self.stats['hits'] += 1
+                return {"hash": content_hash, "html": html}
+            if self._renderer is None:
+                self._renderer = MarkdownIt('commonmark', {'html': False}).enable(['table', 'strikethrough'])
+            renderer = self._renderer
+        
+        html = renderer.render(content)
+        with self._lock:
+            self.stats['misses'] += 1
+            self._html[content_hash] = html
+            while len(self._html) > self.max_entries:
+                self._html.popitem(last=False)
+                self.stats['evictions'] += 1
+        return {"hash": content_hash, "html": html}
+    
+    def size(self) -> int:
+        return len(self._html)
+
+markdown_cache = MarkdownCache(MARKDOWN_CACHE_MAX_ENTRIES)
+
+class MarkdownRender(BaseModel):
+    content: str
+
+async def render_markdown_response(content: str) -> Dict:
+    """Render markdown off the event loop, or 501 if the renderer isn't installed"""
+    if MarkdownIt is None:
+        raise HTTPException(status_code=501, detail="Server-side markdown rendering requires markdown-it-py")
+    return await asyncio.to_thread(markdown_cache.render, content)
+
+@app.post("/api/markdown/render")
+async def render_markdown(markdown: MarkdownRender):
+    """Render markdown that isn't stored, such as unsaved edits or a local file"""
+    return await render_markdown_response(markdown.content)
+
 # Markdown file endpoints
 @app.post("/api/markdown/upload")
 async def upload_markdown(file: UploadFile = File(...)):
@@ -1880,6 +2556,15 @@ async def get_markdown(file_id: str):
     
     return {"file": file_data}
 
+@app.get("/api/markdown/{file_id}/html")
+async def get_markdown_html(file_id: str):
+    """Get a markdown file rendered to sanitized HTML"""
+    file_data = db.get_markdown_file(file_id)
+    if not file_data:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return await render_markdown_response(file_data['content'])
+
 @app.put("/api/markdown/{file_id}")
 async def update_markdown(file_id: str, content: dict):
     """Update a markdown file"""
@@ -1941,7 +2626,7 @@ async def view_pdf(file_id: str):
         content=file_data['file_data'],
         media_type="application/pdf",
         headers={
-            "Content-Disposition": f"inline; filename={file_data['filename']}"
+            "Content-Disposition": content_disposition(file_data['filename'], "inline")
         }
     )
 
@@ -2060,7 +2745,7 @@ async def export_planner_to_excel(planner_id: str):
         content=excel_bytes.getvalue(),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={
-            "Content-Disposition": f"attachment; filename={filename}"
+            "Content-Disposition": content_disposition(filename)
         }
     )
 
@@ -2199,10 +2884,10 @@ async def read_xlsx_data(file_id: str):
             }
         }
     
-    return {
+    return FastJSONResponse({
         "filename": file_data['filename'],
         "sheets": sheets_data
-    }
+    })
 
 @app.put("/api/xlsx/{file_id}/update")
 async def update_xlsx_data(file_id: str, update_data: Dict[str, Any]):
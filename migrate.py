@@ -218,10 +218,13 @@ Handles schema upgrades for the Gantt Chart application
 """
 import sqlite3
 import os
+import sys
 from datetime import datetime
 
+import database as db
+
 DATABASE_FILE = "gantt_app.db"
-MIGRATION_VERSION = 3  # Current migration version
+MIGRATION_VERSION = 15  # Current migration version
 
 def get_connection():
     """Get a database connection"""
@@ -290,6 +293,55 @@ def apply_migration(version, description, migration_sql):
     finally:
         conn.close()
 
+def apply_python_migration(version, description, migration_func):
+    """Apply a migration implemented in Python and record it"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    print(f"Applying migration v{version}: {description}")
+    
+    try:
+        migration_func(cursor)
+        
+        cursor.execute('''
+            INSERT INTO schema_version (version, description, applied_at)
+            VALUES (?, ?, ?)
+        ''', (version, description, datetime.now().isoformat()))
+        
+        conn.commit()
+        print(f"✓ Migration v{version} applied successfully")
+        return True
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Migration v{version} failed: {e}")
+        return False
+    finally:
+        conn.close()
+
+def reported(step, message):
+    """Wrap a silent schema step so its migration prints what it did"""
+    def migration_func(cursor):
+        print(f"  {message.format(step(cursor))}")
+    return migration_func
+
+def vacuum_database():
+    """Reclaim space freed by a migration"""
+    conn = get_connection()
+    conn.execute('VACUUM')
+    
+    # VACUUM may renumber rowids, which the search and interval indexes are keyed on
+    for fts_table, _, _ in SEARCH_INDEXES:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,)).fetchone()
+        if exists:
+            conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'task_intervals'").fetchone():
+        fill_task_intervals(conn.cursor())
+    
+    conn.commit()
+    conn.close()
+
 def migration_v1():
     """Migration v1: Add weekly planner tables"""
     description = "Add weekly planner and xlsx storage tables"
@@ -379,6 +431,447 @@ def migration_v3():
     
     return apply_migration(3, description, migration_sql)
 
+def compact_action_logs(cursor):
+    """Rewrite snapshot-style action log details as field-level diffs"""
+    tables = ['action_logs'] + db.list_log_partitions(cursor)
+    cursor.execute(' UNION ALL '.join(
+        f"SELECT '{table}' AS source, id, task_id, action, details, timestamp FROM {table}"
+        for table in tables
+    ) + ' ORDER BY task_id, timestamp')
+    rows = cursor.fetchall()
+    
+    rewritten = 0
+    
+    for row in rows:
+        details = db.decode_log_details(row['details'])
+        compact = None
+        
+        if row['action'] == 'UPDATE' and 'old' in details and 'new' in details:
+            compact = {'diff': db.diff_task(details['old'], details['new'])}
+        elif row['action'] == 'DELETE' and details and 'snapshot' not in details:
+            # Retention can expire the entries a deleted task would be replayed from
+            compact = {'snapshot': details}
+        
+        if compact is not None:
+            cursor.execute(f"UPDATE {row['source']} SET details = ? WHERE id = ?",
+                         (db.encode_log_details(compact), row['id']))
+            rewritten += 1
+    
+    print(f"  Rewrote {rewritten} of {len(rows)} action log entries")
+
+def migration_v4():
+    """Migration v4: Store action log details as compact diffs"""
+    description = "Rewrite action log details as field-level diffs"
+    
+    if not apply_python_migration(4, description, compact_action_logs):
+        return False
+    
+    vacuum_database()
+    return True
+
+def migration_v5():
+    """Migration v5: Add per-project log retention policies"""
+    description = "Add log retention policy table"
+    
+    migration_sql = '''
+        CREATE TABLE IF NOT EXISTS log_retention_policies (
+            project_id TEXT PRIMARY KEY,
+            retention_days INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+        )
+    '''
+    
+    return apply_migration(5, description, migration_sql)
+
+def add_log_keyset_indexes(cursor):
+    """Replace log partition indexes with (column, timestamp, id) keyset indexes"""
+    partitions = db.list_log_partitions(cursor)
+    for table in partitions:
+        cursor.execute(f'DROP INDEX IF EXISTS idx_{table}_project_ts')
+        cursor.execute(f'DROP INDEX IF EXISTS idx_{table}_task_id')
+        db.ensure_log_partition(cursor, table)
+    
+    print(f"  Reindexed {len(partitions)} log partitions")
+
+def migration_v6():
+    """Migration v6: Add keyset pagination indexes to log partitions"""
+    description = "Add (project_id, timestamp, id) and (task_id, timestamp, id) log indexes"
+    
+    return apply_python_migration(6, description, add_log_keyset_indexes)
+
+# Full-text search indexes: (fts table, source table, indexed columns)
+SEARCH_INDEXES = [
+    ('tasks_fts', 'tasks', ['name', 'description']),
+    ('notes_fts', 'project_notes', ['content']),
+    ('markdown_fts', 'markdown_files', ['filename', 'content'])
+]
+
+def create_search_tables(cursor, indexes=SEARCH_INDEXES):
+    """Create external-content FTS5 tables and their sync triggers, left empty"""
+    for fts_table, source, columns in indexes:
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {column_list}, content='{source}', content_rowid='rowid', tokenize='porter unicode61'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {source} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
+        ''')
+
+def create_search_indexes(cursor, indexes=SEARCH_INDEXES) -> str:
+    """Create the FTS5 search tables and fill them from their sources
+    
+    Returns the indexed source tables.
+    """
+    create_search_tables(cursor, indexes)
+    for fts_table, _, _ in indexes:
+        cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    
+    return ', '.join(source for _, source, _ in indexes)
+
+def migration_v7():
+    """Migration v7: Add full-text search over tasks, notes and markdown files"""
+    description = "Add FTS5 search indexes with sync triggers"
+    
+    return apply_python_migration(7, description, reported(create_search_indexes, "Indexed {}"))
+
+def migration_v8():
+    """Migration v8: Add composite indexes for task queries"""
+    description = "Add task indexes for date window, assignee and priority filters"
+    
+    migration_sql = '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_project_dates ON tasks(project_id, start_date, end_date);
+        CREATE INDEX IF NOT EXISTS idx_tasks_project_assignee ON tasks(project_id, assigned_to);
+        CREATE INDEX IF NOT EXISTS idx_tasks_project_priority ON tasks(project_id, priority)
+    '''
+    
+    return apply_migration(8, description, migration_sql)
+
+# Day number (days since 1970-01-01) of an ISO date, as stored in task_intervals
+DAY_NUMBER_SQL = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+
+def fill_task_intervals(cursor):
+    """Rebuild the task interval index from the tasks table"""
+    start_day = DAY_NUMBER_SQL.format('start_date')
+    end_day = DAY_NUMBER_SQL.format('end_date')
+    
+    cursor.execute('DELETE FROM task_intervals')
+    cursor.execute(f'''
+        INSERT INTO task_intervals (id, start_day, end_day, project_id)
+        SELECT rowid, min({start_day}, {end_day}), max({start_day}, {end_day}), project_id
+        FROM tasks
+        WHERE julianday(start_date) IS NOT NULL AND julianday(end_date) IS NOT NULL
+    ''')
+
+def create_task_interval_table(cursor):
+    """Create the R*Tree interval index over task dates and its sync triggers, left empty"""
+    new_start = DAY_NUMBER_SQL.format('new.start_date')
+    new_end = DAY_NUMBER_SQL.format('new.end_date')
+    upsert = f'''
+        INSERT OR REPLACE INTO task_intervals (id, start_day, end_day, project_id)
+        SELECT new.rowid, min({new_start}, {new_end}), max({new_start}, {new_end}), new.project_id
+        WHERE julianday(new.start_date) IS NOT NULL AND julianday(new.end_date) IS NOT NULL;
+    '''
+    
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS task_intervals USING rtree_i32(
+            id, start_day, end_day, +project_id
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_intervals_ai AFTER INSERT ON tasks BEGIN
+            {upsert}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_intervals_au AFTER UPDATE OF start_date, end_date, project_id ON tasks BEGIN
+            DELETE FROM task_intervals WHERE id = old.rowid;
+            {upsert}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS task_intervals_ad AFTER DELETE ON tasks BEGIN
+            DELETE FROM task_intervals WHERE id = old.rowid;
+        END
+    ''')
+
+def create_task_intervals(cursor) -> int:
+    """Create the task interval index and fill it
+    
+    Returns the number of tasks indexed.
+    """
+    create_task_interval_table(cursor)
+    fill_task_intervals(cursor)
+    
+    cursor.execute('SELECT COUNT(*) FROM task_intervals')
+    return cursor.fetchone()[0]
+
+def migration_v9():
+    """Migration v9: Add an R*Tree interval index over task dates"""
+    description = "Add task_intervals R*Tree for timeline window queries"
+    
+    return apply_python_migration(9, description, reported(create_task_intervals, "Indexed {} task intervals"))
+
+def fill_task_paths(cursor):
+    """Recompute every task's materialized path from parent_id"""
+    cursor.execute('''
+        WITH RECURSIVE tree(id, path) AS (
+            SELECT id, '/' || id || '/' FROM tasks
+            WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM tasks)
+            UNION ALL
+            SELECT t.id, tree.path || t.id || '/' FROM tasks t JOIN tree ON t.parent_id = tree.id
+        )
+        UPDATE tasks SET path = (SELECT path FROM tree WHERE tree.id = tasks.id)
+    ''')
+
+def add_task_path_column(cursor):
+    """Add a materialized path column to tasks, kept current by triggers"""
+    cursor.execute('PRAGMA table_info(tasks)')
+    if 'path' not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE tasks ADD COLUMN path TEXT')
+    db.create_task_path_triggers(cursor)
+
+def add_task_paths(cursor) -> int:
+    """Add the task path column and compute every task's path
+    
+    Returns the number of tasks with a path.
+    """
+    add_task_path_column(cursor)
+    fill_task_paths(cursor)
+    
+    cursor.execute('SELECT COUNT(*) FROM tasks WHERE path IS NOT NULL')
+    return cursor.fetchone()[0]
+
+def migration_v10():
+    """Migration v10: Add materialized task paths for subtree range scans"""
+    description = "Add tasks.path materialized hierarchy with sync triggers"
+    
+    return apply_python_migration(10, description, reported(add_task_paths, "Computed paths for {} tasks"))
+
+def fill_task_rollups(cursor):
+    """Recompute every task's subtree roll-up, deepest tasks first"""
+    depth = "length(path) - length(replace(path, '/', ''))"
+    cursor.execute(f'SELECT DISTINCT {depth} AS depth FROM tasks ORDER BY depth DESC')
+    for row in cursor.fetchall():
+        cursor.execute(db.ROLLUP_UPDATE_SQL.format(where=f'{depth} = ?'), (row['depth'],))
+
+def add_task_rollup_columns(cursor):
+    """Add server-maintained subtree roll-up columns to tasks"""
+    cursor.execute('PRAGMA table_info(tasks)')
+    existing = {row['name'] for row in cursor.fetchall()}
+    for column, column_type in [('rollup_start', 'TEXT'), ('rollup_end', 'TEXT'),
+                                ('rollup_progress', 'REAL'), ('rollup_duration', 'REAL')]:
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE tasks ADD COLUMN {column} {column_type}')
+
+def add_task_rollups(cursor) -> int:
+    """Add the roll-up columns and roll up every task's subtree
+    
+    Returns the number of subtasks rolled up.
+    """
+    add_task_rollup_columns(cursor)
+    fill_task_rollups(cursor)
+    
+    cursor.execute('SELECT COUNT(*) FROM tasks WHERE parent_id IS NOT NULL')
+    return cursor.fetchone()[0]
+
+def migration_v11():
+    """Migration v11: Add rolled-up progress and dates to tasks"""
+    description = "Add tasks roll-up columns for subtree progress and dates"
+    
+    return apply_python_migration(11, description, reported(add_task_rollups, "Rolled up {} subtasks into their parents"))
+
+# Shards (database.SHARDED_STORAGE) hold one project's tasks and action logs.
+# They are created directly at the current schema rather than migrated, and
+# record it as PRAGMA user_version so later opens skip the DDL. Creating a
+# shard never fills indexes: a new shard is empty, and move_projects_to_shards
+# fills the ones it populates. SHARD_SCHEMA_VERSION goes up whenever
+# create_shard_schema changes.
+SHARD_SCHEMA_VERSION = 1
+
+SHARD_TASK_COLUMNS = ('id, project_id, name, start_date, end_date, progress, color, dependencies, '
+                      'is_milestone, parent_id, description, assigned_to, priority, created_at, updated_at')
+
+def create_shard_schema(cursor):
+    """Create a project shard's tasks table, its indexes and triggers, if it is behind
+    
+    Runs when a shard is first opened, so it prints nothing.
+    """
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] >= SHARD_SCHEMA_VERSION:
+        return
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            progress REAL DEFAULT 0.0,
+            color TEXT DEFAULT '#4285f4',
+            dependencies TEXT DEFAULT '[]',
+            is_milestone INTEGER DEFAULT 0,
+            parent_id TEXT,
+            description TEXT,
+            assigned_to TEXT,
+            priority TEXT DEFAULT 'medium',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_project_id ON tasks(project_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_parent_id ON tasks(parent_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_project_dates ON tasks(project_id, start_date, end_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_project_assignee ON tasks(project_id, assigned_to)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_project_priority ON tasks(project_id, priority)')
+    
+    create_search_tables(cursor, [index for index in SEARCH_INDEXES if index[1] == 'tasks'])
+    create_task_interval_table(cursor)
+    add_task_path_column(cursor)
+    add_task_rollup_columns(cursor)
+    cursor.execute(f'PRAGMA user_version = {SHARD_SCHEMA_VERSION}')
+
+def move_projects_to_shards(cursor):
+    """Move every project's tasks and action logs from the catalog into its shard
+    
+    Rows already in a shard are kept, so an interrupted move can be rerun.
+    """
+    cursor.execute('SELECT id FROM projects')
+    project_ids = [row['id'] for row in cursor.fetchall()]
+    partitions = db.list_log_partitions(cursor)
+    
+    for project_id in project_ids:
+        shard = db.shard_pool.connect(project_id)
+        shard_cursor = shard.cursor()
+        
+        cursor.execute(f'SELECT {SHARD_TASK_COLUMNS} FROM tasks WHERE project_id = ?', (project_id,))
+        tasks = [tuple(row) for row in cursor.fetchall()]
+        shard_cursor.executemany(f'''
+            INSERT OR IGNORE INTO tasks ({SHARD_TASK_COLUMNS})
+            VALUES ({', '.join('?' * len(SHARD_TASK_COLUMNS.split(', ')))})
+        ''', tasks)
+        # Paths were computed in insert order, which may put children before parents
+        fill_task_paths(shard_cursor)
+        fill_task_rollups(shard_cursor)
+        
+        logs = 0
+        for table in partitions:
+            cursor.execute(f'SELECT * FROM {table} WHERE project_id = ?', (project_id,))
+            rows = [tuple(row) for row in cursor.fetchall()]
+            if rows:
+                db.ensure_log_partition(shard_cursor, table)
+                shard_cursor.executemany(f'INSERT OR IGNORE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                logs += len(rows)
+        
+        shard.commit()
+        shard.close()
+        
+        cursor.executemany('INSERT OR REPLACE INTO task_shards (task_id, project_id) VALUES (?, ?)',
+                           [(task[0], project_id) for task in tasks])
+        cursor.execute('DELETE FROM tasks WHERE project_id = ?', (project_id,))
+        for table in partitions:
+            cursor.execute(f'DELETE FROM {table} WHERE project_id = ?', (project_id,))
+        print(f"  Moved {len(tasks)} tasks and {logs} logs into the shard for {project_id}")
+
+def add_task_shards(cursor):
+    """Add the catalog table mapping tasks to the project shard holding them"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_shards (
+            task_id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_shards_project ON task_shards(project_id)')
+    
+    if db.SHARDED_STORAGE:
+        move_projects_to_shards(cursor)
+
+def migration_v12():
+    """Migration v12: Add the task shard catalog for sharded storage"""
+    description = "Add task_shards catalog table for per-project shard databases"
+    
+    return apply_python_migration(12, description, add_task_shards)
+
+def add_note_revisions(cursor):
+    """Add a revision counter to notes, unless init_database already created it"""
+    cursor.execute('PRAGMA table_info(project_notes)')
+    if 'revision' not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE project_notes ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+
+def migration_v13():
+    """Migration v13: Add note revisions for patch-based editing"""
+    description = "Add project_notes.revision for note patch conflict detection"
+    
+    return apply_python_migration(13, description, add_note_revisions)
+
+def merge_duplicate_notes(cursor):
+    """Fold notes sharing a project and date into the most recently updated one
+    
+    Older bodies that differ are appended to the kept note, so no text is lost.
+    """
+    cursor.execute('''
+        SELECT project_id, note_date FROM project_notes 
+        GROUP BY project_id, note_date HAVING COUNT(*) > 1
+    ''')
+    duplicates = cursor.fetchall()
+    
+    for group in duplicates:
+        cursor.execute('''
+            SELECT id, content, revision FROM project_notes 
+            WHERE project_id = ? AND note_date = ?
+            ORDER BY updated_at DESC
+        ''', (group['project_id'], group['note_date']))
+        kept, *others = cursor.fetchall()
+        
+        contents = [kept['content']]
+        for note in others:
+            if note['content'] not in contents:
+                contents.append(note['content'])
+        
+        cursor.execute('UPDATE project_notes SET content = ?, revision = ? WHERE id = ?',
+                       ('\n\n---\n\n'.join(contents), kept['revision'] + 1, kept['id']))
+        cursor.executemany('DELETE FROM project_notes WHERE id = ?', [(note['id'],) for note in others])
+    
+    print(f"  Merged duplicate notes on {len(duplicates)} dates")
+
+def add_unique_note_dates(cursor):
+    """Make (project_id, note_date) unique so note saves can be upserts"""
+    merge_duplicate_notes(cursor)
+    cursor.execute('DROP INDEX IF EXISTS idx_notes_project_date')
+    cursor.execute('CREATE UNIQUE INDEX idx_notes_project_date ON project_notes(project_id, note_date)')
+
+def migration_v14():
+    """Migration v14: One note per project and date"""
+    description = "Make idx_notes_project_date unique for note upserts"
+    
+    return apply_python_migration(14, description, add_unique_note_dates)
+
+def migration_v15():
+    """Migration v15: Settings shared by every worker process"""
+    description = "Add app_settings for the cookie secret and a project change counter"
+    
+    return apply_python_migration(15, description, db.create_app_settings)
+
 def run_migrations():
     """Run all pending migrations"""
     if not os.path.exists(DATABASE_FILE):
@@ -399,7 +892,19 @@ def run_migrations():
     migrations = [
         (1, migration_v1),
         (2, migration_v2),
-        (3, migration_v3)
+        (3, migration_v3),
+        (4, migration_v4),
+        (5, migration_v5),
+        (6, migration_v6),
+        (7, migration_v7),
+        (8, migration_v8),
+        (9, migration_v9),
+        (10, migration_v10),
+        (11, migration_v11),
+        (12, migration_v12),
+        (13, migration_v13),
+        (14, migration_v14),
+        (15, migration_v15)
     ]
     
     success = True
@@ -422,4 +927,15 @@ if __name__ == "__main__":
     print("Gantt Chart Application - Database Migration")
     print("=" * 60)
     print()
-    run_migrations()
\ No newline at end of file
+    if '--move-to-shards' in sys.argv:
+        # For switching an installation that is already at v12 to sharded storage
+        if not db.SHARDED_STORAGE:
+            print("✗ Set GANTT_STORAGE=sharded to move projects into shards")
+        elif run_migrations():
+            conn = get_connection()
+            move_projects_to_shards(conn.cursor())
+            conn.commit()
+            conn.close()
+            print("✓ Project data moved into shards")
+    else:
+        run_migrations()
\ No newline at end of file
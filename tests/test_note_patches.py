@@ -0,0 +1,156 @@
+"""
+Tests for note text patches: apply_text_patches on the server, and the
+diffText/rebaseTextPatch helpers and patchNote the editor uses to send them
+
+Run from the repository root: python -m pytest tests
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import apply_text_patches
+
+# apply_text_patches
+
+def test_applies_patches_in_order():
+    patches = [
+        {'start': 0, 'end': 5, 'text': 'Goodbye'},
+        {'start': 7, 'end': 7, 'text': ','}
+    ]
+    assert apply_text_patches('Hello world', patches) == 'Goodbye, world'
+
+def test_insert_and_delete():
+    assert apply_text_patches('abc', [{'start': 3, 'end': 3, 'text': 'd'}]) == 'abcd'
+    assert apply_text_patches('abcd', [{'start': 1, 'end': 3, 'text': ''}]) == 'ad'
+    assert apply_text_patches('abc', []) == 'abc'
+
+def test_offsets_are_utf16_code_units():
+    # The emoji is two code units, as String.length counts it in the browser
+    assert apply_text_patches('😀x', [{'start': 2, 'end': 3, 'text': 'y'}]) == '😀y'
+    assert apply_text_patches('😀', [{'start': 0, 'end': 2, 'text': '😃'}]) == '😃'
+
+def test_range_outside_note_is_rejected():
+    with pytest.raises(ValueError):
+        apply_text_patches('abc', [{'start': 2, 'end': 4, 'text': ''}])
+    with pytest.raises(ValueError):
+        apply_text_patches('abc', [{'start': 2, 'end': 1, 'text': ''}])
+
+def test_patch_splitting_a_surrogate_pair_is_rejected():
+    with pytest.raises(ValueError):
+        apply_text_patches('😀', [{'start': 1, 'end': 2, 'text': '\ude03'}])
+
+# Editor helpers (static/index.html), run with node
+
+HELPERS = ['isHighSurrogate', 'isLowSurrogate', 'diffText', 'applyTextPatch', 'rebaseTextPatch', 'patchNote']
+
+def _editor_helpers() -> str:
+    with open(os.path.join(ROOT, 'static', 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    sources = []
+    for name in HELPERS:
+        match = re.search(r'^( *)(?:async )?function ' + name + r'\(.*?^\1}$', html, re.M | re.S)
+        assert match, f"{name} not found in static/index.html"
+        sources.append(match.group(0))
+    return '\n'.join(sources)
+
+def run_js(expression: str, setup: str = ''):
+    """Evaluate an expression, awaited if it is a promise, with the editor helpers in scope"""
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip("node is not installed")
+    script = (_editor_helpers() + '\n' + setup +
+              f'\nPromise.resolve({expression}).then(value => process.stdout.write(JSON.stringify(value)));')
+    result = subprocess.run([node, '-e', script], capture_output=True, text=True, encoding='utf-8', check=True)
+    return json.loads(result.stdout)
+
+def js(value: str) -> str:
+    return json.dumps(value)
+
+@pytest.mark.parametrize('before,after', [
+    ('Hello world', 'Hello there world'),
+    ('abc', ''),
+    ('', 'abc'),
+    ('aaa', 'aa'),
+    ('😀', '😃'),
+    ('note 😀 end', 'note 😃 end'),
+    ('\U00010000x', '\U00010400x'),
+    ('😀😀', '😀'),
+    ('a😀b', 'ab')
+])
+def test_diff_text_round_trips_through_the_server(before, after):
+    patch = run_js(f'diffText({js(before)}, {js(after)})')
+    assert apply_text_patches(before, [patch]) == after
+
+def test_diff_text_never_splits_a_surrogate_pair():
+    patch = run_js(f'diffText({js("😀")}, {js("😃")})')
+    assert patch == {'start': 0, 'end': 2, 'text': '😃'}
+    patch = run_js(f'diffText({js(chr(0x10000))}, {js(chr(0x10400))})')
+    assert patch == {'start': 0, 'end': 2, 'text': chr(0x10400)}
+
+def test_diff_text_of_equal_texts_is_null():
+    assert run_js('diffText("same", "same")') is None
+
+def test_rebase_shifts_a_patch_after_their_change():
+    base, server = 'one two three', 'one 2 two three'
+    patch = {'start': 8, 'end': 13, 'text': '3'}
+    rebased = run_js(f'rebaseTextPatch({js(patch)}, {js(base)}, {js(server)})')
+    assert rebased == {'start': 10, 'end': 15, 'text': '3'}
+    assert apply_text_patches(server, [rebased]) == 'one 2 two 3'
+
+def test_rebase_keeps_a_patch_before_their_change():
+    base, server = 'one two three', 'one two 3'
+    patch = {'start': 0, 'end': 3, 'text': '1'}
+    rebased = run_js(f'rebaseTextPatch({js(patch)}, {js(base)}, {js(server)})')
+    assert rebased == patch
+    assert apply_text_patches(server, [rebased]) == '1 two 3'
+
+def test_rebase_past_an_emoji_edit():
+    base, server = '😀 and text', '😃😃 and text'
+    patch = {'start': 7, 'end': 11, 'text': 'more'}
+    rebased = run_js(f'rebaseTextPatch({js(patch)}, {js(base)}, {js(server)})')
+    assert apply_text_patches(server, [rebased]) == '😃😃 and more'
+
+def test_rebase_of_overlapping_edits_is_null():
+    base, server = 'one two three', 'one TWO three'
+    patch = {'start': 5, 'end': 6, 'text': 'W'}
+    assert run_js(f'rebaseTextPatch({js(patch)}, {js(base)}, {js(server)})') is None
+
+def test_rebase_without_their_change_is_unchanged():
+    patch = {'start': 1, 'end': 2, 'text': 'x'}
+    assert run_js(f'rebaseTextPatch({js(patch)}, "abc", "abc")') == patch
+
+# patchNote against a stubbed server that keeps answering 409
+PATCH_SERVER = """
+let selectedNoteDate = 'day';
+const textarea = { value: EDITED };
+const document = { getElementById: () => textarea };
+let noteBase = { id: 'n1', date: 'day', revision: 0, content: BASE };
+const requests = [];
+async function fetch(url, options) {
+    requests.push(options.method);
+    if (options.method === 'PATCH') {
+        const note = { revision: requests.length, content: BASE };
+        return { ok: false, status: 409, json: async () => ({ detail: { note } }) };
+    }
+    const content = JSON.parse(options.body).content;
+    return { ok: true, status: 200, json: async () => ({ note: { revision: 9, content } }) };
+}
+"""
+
+def test_patch_note_falls_back_to_a_full_save_after_repeated_conflicts():
+    base, edited = '  base\n', '  edited text\n\n'
+    setup = PATCH_SERVER.replace('EDITED', js(edited)).replace('BASE', js(base))
+    result = run_js(f'patchNote({js(edited)}).then(() => ({{ requests, noteBase, value: textarea.value }}))', setup)
+    assert result['requests'] == ['PATCH', 'PATCH', 'PUT']
+    assert result['noteBase']['revision'] == 9
+    # Leading and trailing whitespace survive the rebases and the save
+    assert result['noteBase']['content'] == edited
+    assert result['value'] == edited
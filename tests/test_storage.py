@@ -0,0 +1,235 @@
+"""
+Tests for the storage layer: compact log details, keyset log paging across
+partitions, task paths and roll-ups, the task cache and group commits
+
+Each test runs against a fresh database in a temporary directory.
+Run from the repository root: python -m pytest tests
+"""
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database as db
+
+PROJECT_ID = 'p1'
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db.task_cache.invalidate()
+    db.init_database()
+    now = datetime.now().isoformat()
+    db.create_project({'id': PROJECT_ID, 'name': 'Project', 'created_at': now, 'updated_at': now})
+    yield
+    db.task_cache.invalidate()
+
+def make_task(task_id: str, start_date: str, end_date: str, parent_id: str = None, progress: int = 0, **fields):
+    now = datetime.now().isoformat()
+    task = {
+        'id': task_id, 'project_id': PROJECT_ID, 'name': task_id,
+        'start_date': start_date, 'end_date': end_date, 'progress': progress,
+        'color': '#4285f4', 'dependencies': [], 'is_milestone': False, 'parent_id': parent_id,
+        'description': None, 'assigned_to': None, 'priority': 'medium',
+        'created_at': now, 'updated_at': now
+    }
+    task.update(fields)
+    db.create_task(task)
+    return db.get_task_by_id(task_id)
+
+def make_log(log_id: str, timestamp: str, action: str = 'CREATE', details: dict = None, task_id: str = 't1'):
+    return {
+        'id': log_id, 'project_id': PROJECT_ID, 'action': action, 'task_id': task_id,
+        'task_name': task_id, 'timestamp': timestamp, 'details': details or {}
+    }
+
+def task_path(task_id: str) -> str:
+    conn = db.get_connection()
+    row = conn.execute('SELECT path FROM tasks WHERE id = ?', (task_id,)).fetchone()
+    conn.close()
+    return row['path']
+
+# Compact log details
+
+def test_large_details_are_compressed_and_decode_unchanged():
+    details = {'snapshot': {'id': 't1', 'description': 'x' * (db.LOG_COMPRESSION_THRESHOLD + 1)}}
+    encoded = db.encode_log_details(details)
+    assert isinstance(encoded, bytes)
+    assert db.decode_log_details(encoded) == details
+
+    small = {'diff': {'name': ['a', 'b']}}
+    assert isinstance(db.encode_log_details(small), str)
+    assert db.decode_log_details(db.encode_log_details(small)) == small
+
+def test_compact_history_expands_to_full_task_views():
+    created = make_task('t1', '2024-01-01', '2024-01-05', name='Old')
+    updated = dict(created, name='New', description='d' * (db.LOG_COMPRESSION_THRESHOLD + 1), progress=40)
+    diff = db.diff_task(created, updated)
+    assert set(diff) == {'name', 'description', 'progress'}
+
+    db.create_logs([
+        make_log('l1', '2024-01-01T10:00:00', 'CREATE', db.task_snapshot(created)),
+        make_log('l2', '2024-01-02T10:00:00', 'UPDATE', {'diff': diff}),
+        make_log('l3', '2024-01-03T10:00:00', 'DELETE', {'snapshot': db.task_snapshot(updated)})
+    ])
+
+    conn = db.get_connection()
+    raw = conn.execute('SELECT details FROM action_logs_2024_01 WHERE id = ?', ('l3',)).fetchone()['details']
+    conn.close()
+    assert isinstance(raw, bytes)
+
+    delete, update, create = db.get_task_logs('t1', expand=True)
+    assert create['details']['name'] == 'Old'
+    assert update['details']['old']['name'] == 'Old'
+    assert update['details']['new']['name'] == 'New'
+    assert update['details']['new']['progress'] == 40
+    assert update['details']['new']['start_date'] == '2024-01-01'
+    assert update['details']['new']['updated_at'] == '2024-01-02T10:00:00'
+    assert update['details']['changes'] == {'name': 'New', 'description': updated['description'], 'progress': 40}
+    assert delete['details'] == db.task_snapshot(updated)
+
+# Keyset paging over log partitions
+
+PAGED_LOGS = [
+    ('l0', '2024-01-15T08:00:00'),
+    ('l1', '2024-01-31T23:59:59'),
+    ('l2', '2024-01-31T23:59:59'),
+    ('l3', '2024-01-31T23:59:59'),
+    ('l4', '2024-02-01T00:00:00'),
+    ('l5', '2024-02-01T00:00:00')
+]
+
+@pytest.fixture
+def paged_logs():
+    db.create_logs([make_log(log_id, timestamp) for log_id, timestamp in reversed(PAGED_LOGS)])
+    conn = db.get_connection()
+    assert db.list_log_partitions(conn.cursor()) == ['action_logs_2024_02', 'action_logs_2024_01']
+    conn.close()
+    return [log_id for log_id, _ in PAGED_LOGS]
+
+def test_project_log_pages_cross_ties_and_partitions(paged_logs):
+    pages = []
+    before = None
+    while True:
+        page = db.get_logs(PROJECT_ID, limit=2, before=before)
+        if not page:
+            break
+        pages.append([log['id'] for log in page])
+        before = (page[0]['timestamp'], page[0]['id'])
+
+    # The three-way tie on Jan 31 is split across pages, and the last
+    # page reaches back past the month boundary
+    assert pages == [['l4', 'l5'], ['l2', 'l3'], ['l0', 'l1']]
+
+def test_task_log_pages_cross_ties_and_partitions(paged_logs):
+    seen = []
+    before = None
+    while True:
+        page = db.get_task_logs('t1', limit=4, before=before)
+        if not page:
+            break
+        seen.extend(log['id'] for log in page)
+        before = (page[-1]['timestamp'], page[-1]['id'])
+
+    assert seen == list(reversed(paged_logs))
+
+# Task paths and roll-ups
+
+@pytest.fixture
+def tree():
+    make_task('a', '2024-01-01', '2024-01-05', progress=20)
+    make_task('b', '2024-01-01', '2024-01-02')
+    make_task('a1', '2024-01-10', '2024-01-20', parent_id='a', progress=50)
+    make_task('a1x', '2024-01-15', '2024-01-25', parent_id='a1', progress=100)
+
+def test_paths_and_rollups_follow_the_tree(tree):
+    assert task_path('a1x') == '/a/a1/a1x/'
+    a = db.get_task_by_id('a')
+    assert (a['rollup_start'], a['rollup_end'], a['rollup_progress']) == ('2024-01-01', '2024-01-25', 100)
+    assert db.is_in_subtree('a1x', 'a')
+    assert not db.is_in_subtree('a1x', 'b')
+
+def test_moving_a_subtree_updates_paths_and_rollups(tree):
+    db.update_task('a1', {'parent_id': 'b'})
+
+    assert task_path('a1') == '/b/a1/'
+    assert task_path('a1x') == '/b/a1/a1x/'
+    assert task_path('a') == '/a/'
+    assert db.is_in_subtree('a1x', 'b')
+    assert not db.is_in_subtree('a1x', 'a')
+
+    # The old parent falls back to its own fields, the new one takes on the subtree
+    a = db.get_task_by_id('a')
+    assert (a['rollup_start'], a['rollup_end'], a['rollup_progress']) == ('2024-01-01', '2024-01-05', 20)
+    b = db.get_task_by_id('b')
+    assert (b['rollup_start'], b['rollup_end'], b['rollup_progress']) == ('2024-01-01', '2024-01-25', 100)
+
+def test_changing_a_leaf_updates_ancestor_rollups(tree):
+    db.update_task('a1x', {'end_date': '2024-02-10', 'progress': 0})
+    a = db.get_task_by_id('a')
+    assert (a['rollup_end'], a['rollup_progress']) == ('2024-02-10', 0)
+
+# Task cache
+
+def test_cached_tasks_see_committed_writes(tree):
+    db.get_all_tasks(PROJECT_ID)
+    assert db.task_cache.contains(PROJECT_ID)
+
+    db.update_task('a1x', {'name': 'renamed', 'end_date': '2024-03-01'})
+    tasks = {task['id']: task for task in db.get_all_tasks(PROJECT_ID)}
+    assert tasks['a1x']['name'] == 'renamed'
+    # Ancestors whose roll-ups changed are refreshed too
+    assert tasks['a']['rollup_end'] == '2024-03-01'
+
+    db.delete_task('a1')
+    assert sorted(task['id'] for task in db.get_all_tasks(PROJECT_ID)) == ['a', 'b']
+    assert db.task_cache.size() == 2
+
+def test_tasks_read_before_a_write_are_not_cached(tree):
+    generation = db.task_cache.generation(PROJECT_ID)
+    stale = list(db.iter_tasks(PROJECT_ID))
+    db.update_task('b', {'name': 'renamed'})
+
+    assert not db.task_cache.load(PROJECT_ID, stale, generation)
+    assert not db.task_cache.contains(PROJECT_ID)
+    names = {task['id']: task['name'] for task in db.get_all_tasks(PROJECT_ID)}
+    assert names['b'] == 'renamed'
+
+# Group commits
+
+def test_failed_write_in_a_group_commit_keeps_the_others(tree):
+    committer = db.GroupCommitter(window=0.5, max_batch=3)
+    committer.start()
+    errors = {}
+
+    def rename(task_id, fail=False):
+        def write(cursor):
+            cursor.execute('UPDATE tasks SET name = ? WHERE id = ?', (f'{task_id} renamed', task_id))
+            if fail:
+                raise ValueError('write failed')
+            return task_id
+        try:
+            committer.run(None, write)
+        except ValueError as e:
+            errors[task_id] = e
+
+    threads = [threading.Thread(target=rename, args=('a', False)),
+               threading.Thread(target=rename, args=('b', True)),
+               threading.Thread(target=rename, args=('a1', False))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    committer.stop()
+
+    assert committer.stats['commits'] == 1
+    assert committer.stats['largest_batch'] == 3
+    assert list(errors) == ['b']
+    assert db.get_task_by_id('a')['name'] == 'a renamed'
+    assert db.get_task_by_id('a1')['name'] == 'a1 renamed'
+    assert db.get_task_by_id('b')['name'] == 'b'